@@ -0,0 +1,240 @@
+import json
+import os
+import numpy as np
+from file_parser import FileParser
+
+
+class AlignmentStore:
+    """
+    phones intervals of all alignment files of a corpus, compiled to single columnar file.
+    the file holds a json header (phones names, utterances, columns positions) followed by the columns:
+    utterance offsets, start and end times in milli seconds, phone code and stress digit.
+    columns are memory mapped, so loading the alignment of an utterance doesn't read any text grid file.
+    """
+    magic = b'ALNSTORE'
+    version = 1
+    alignment = 64  # columns start at multiples of this
+    # column name, data type
+    columns = [('offsets', '<i8'), ('start', '<f8'), ('end', '<f8'), ('phone', '<i2'), ('stress', '<i1')]
+    opened = {}  # (store file, modification time and size): store opened by this process when unpickled
+
+    def __init__(self, store_file):
+        self.store_file = store_file
+
+        with open(store_file, 'rb') as store:
+            if store.read(len(self.magic)) != self.magic:
+                raise ValueError(f"{store_file} is not alignment store file")
+            header_size = int.from_bytes(store.read(8), 'little')
+            header = json.loads(store.read(header_size).decode('utf-8'))
+
+        if header['version'] != self.version:
+            raise ValueError(f"{store_file} alignment store version {header['version']} not supported")
+
+        self.phones = header['phones']  # phones names without stress digit
+        self.utterances = header['utterances']  # [utterance id, relative path, mtime in ns, size]
+        self.index = {utterance[0]: index for index, utterance in enumerate(self.utterances)}
+
+        # map columns
+        data_start = AlignmentStore.data_start(header_size)
+        self.arrays = {}
+        for name, dtype in self.columns:
+            offset, count = header['columns'][name]
+            if count:
+                self.arrays[name] = np.memmap(store_file, dtype=dtype, mode='r',
+                                              offset=data_start + offset, shape=(count,))
+            else:
+                self.arrays[name] = np.empty(0, dtype=dtype)
+
+    def __getstate__(self):
+        # worker processes open the file again instead of copying mapped columns
+        stat = os.stat(self.store_file)
+        return {'store_file': self.store_file, 'version': (stat.st_mtime_ns, stat.st_size)}
+
+    def __setstate__(self, state):
+        # parser is sent with each task - open the store once per process, and share it by later tasks
+        key = (state['store_file'], state['version'])
+        if key not in AlignmentStore.opened:
+            AlignmentStore.opened.clear()  # store file was replaced, release previous mapping
+            AlignmentStore.opened[key] = AlignmentStore(state['store_file'])
+        self.__dict__.update(AlignmentStore.opened[key].__dict__)
+
+    def __len__(self):
+        return len(self.utterances)
+
+    def __contains__(self, utterance_id):
+        return utterance_id in self.index
+
+    @classmethod
+    def data_start(cls, header_size):
+        """
+        :param header_size: json header length in bytes
+        :type header_size: int
+        :return: position of first column in file
+        :rtype: int
+        """
+        header_end = len(cls.magic) + 8 + header_size
+        return -(-header_end // cls.alignment) * cls.alignment
+
+    @classmethod
+    def utterance_id(cls, file_path):
+        """
+        :param file_path: audio or text grid file path
+        :type file_path: str
+        :return: utterance id - file name without extension
+        :rtype: str
+        """
+        return os.path.splitext(os.path.basename(file_path))[0]
+
+    def get(self, utterance_id):
+        """
+        get utterance phones intervals, in O(1)
+        :param utterance_id: utterance id (text grid file name without extension)
+        :type utterance_id: str
+        :return: start times, end times in milli seconds, phone codes (index in phones), stress digits (-1 if none)
+        :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray of int16, numpy.ndarray of int8
+        """
+        index = self.index[utterance_id]
+        first, last = self.arrays['offsets'][index], self.arrays['offsets'][index + 1]
+        return (self.arrays['start'][first:last], self.arrays['end'][first:last],
+                self.arrays['phone'][first:last], self.arrays['stress'][first:last])
+
+    @classmethod
+    def split_stress(cls, names, phones, phones_index):
+        """
+        split phones names to phone code and stress digit, adding new phones to phones list
+        :param names: phones names from text grid, with stress digit
+        :type names: numpy.ndarray of str
+        :param phones: phones names without stress digit, updated with new names
+        :type phones: list of str
+        :param phones_index: phone name to index in phones, updated with new names
+        :type phones_index: dict
+        :return: phone codes, stress digits (-1 if none)
+        :rtype: numpy.ndarray of int16, numpy.ndarray of int8
+        """
+        unique_names, inverse = np.unique(names, return_inverse=True)
+        unique_phones = np.empty(len(unique_names), dtype=np.int16)
+        unique_stress = np.empty(len(unique_names), dtype=np.int8)
+
+        for index, name in enumerate(unique_names.tolist()):
+            stress = -1
+            if name.endswith(("0", "1", "2")):
+                name, stress = name[:-1], int(name[-1])
+            if name not in phones_index:
+                phones_index[name] = len(phones)
+                phones.append(name)
+            unique_phones[index] = phones_index[name]
+            unique_stress[index] = stress
+
+        return unique_phones[inverse], unique_stress[inverse]
+
+    @classmethod
+    def compile(cls, txt_path, store_file):
+        """
+        compile all text grid files in alignment folder to store file.
+        if store file exists, only new or changed files (by modification time and size) are parsed again,
+        and the store file is not written again if no file was added, removed or changed.
+        :param txt_path: text grid alignment root path folder
+        :type txt_path: str
+        :param store_file: store file to create or update
+        :type store_file: str
+        :return: the compiled store
+        :rtype: AlignmentStore
+        """
+        previous = None
+        if os.path.exists(store_file):
+            try:
+                previous = cls(store_file)
+            except ValueError:
+                previous = None  # different format - compile again
+
+        # keep previous phones codes, so previous columns stay valid
+        phones = list(previous.phones) if previous else []
+        phones_index = {name: index for index, name in enumerate(phones)}
+
+        utterances = []
+        text_grid_files = []
+        for root, dirs, files in os.walk(txt_path):
+            dirs.sort()
+            for file in sorted(files):
+                if not file.endswith('.TextGrid'):
+                    continue
+
+                text_grid_file = os.path.join(root, file)
+                stat = os.stat(text_grid_file)
+                utterances.append([cls.utterance_id(file), os.path.relpath(text_grid_file, txt_path),
+                                   stat.st_mtime_ns, stat.st_size])
+                text_grid_files.append(text_grid_file)
+
+        if previous is not None and previous.utterances == utterances:
+            # nothing added, removed or changed - keep store file as is
+            print(f"alignment store: {len(utterances)} utterances, 0 text grid files parsed")
+            return previous
+
+        parts = {name: [] for name, dtype in cls.columns if name != 'offsets'}
+        offsets = [0]
+        parsed = 0
+
+        for utterance, text_grid_file in zip(utterances, text_grid_files):
+            previous_index = previous.index.get(utterance[0]) if previous else None
+            if previous_index is not None and previous.utterances[previous_index] == utterance:
+                # not changed - copy from previous store
+                start, end, phone, stress = [np.array(column) for column in previous.get(utterance[0])]
+            else:
+                start, end, names = FileParser.read_phones_tier(text_grid_file)
+                phone, stress = cls.split_stress(names, phones, phones_index)
+                parsed += 1
+
+            parts['start'].append(start)
+            parts['end'].append(end)
+            parts['phone'].append(phone)
+            parts['stress'].append(stress)
+            offsets.append(offsets[-1] + len(start))
+
+        previous = None  # release mapped file before replacing it
+
+        arrays = {'offsets': np.array(offsets)}
+        for name, dtype in cls.columns:
+            if name != 'offsets':
+                arrays[name] = np.concatenate(parts[name]) if parts[name] else np.empty(0)
+            arrays[name] = arrays[name].astype(dtype)
+
+        cls.write(store_file, phones, utterances, arrays)
+        print(f"alignment store: {len(utterances)} utterances, {parsed} text grid files parsed")
+        return cls(store_file)
+
+    @classmethod
+    def write(cls, store_file, phones, utterances, arrays):
+        """
+        write store file, replacing existing file only when done
+        :param store_file: store file path
+        :type store_file: str
+        :param phones: phones names without stress digit
+        :type phones: list of str
+        :param utterances: [utterance id, relative path, mtime in ns, size] for each utterance
+        :type utterances: list
+        :param arrays: columns by name, each already in column data type
+        :type arrays: dict
+        :return: none
+        :rtype:
+        """
+        # columns positions related to data start
+        columns = {}
+        position = 0
+        for name, dtype in cls.columns:
+            columns[name] = [position, len(arrays[name])]
+            position += -(-arrays[name].nbytes // cls.alignment) * cls.alignment
+
+        header = json.dumps({'version': cls.version, 'phones': phones,
+                             'utterances': utterances, 'columns': columns}).encode('utf-8')
+        data_start = cls.data_start(len(header))
+
+        temp_file = store_file + ".tmp"
+        with open(temp_file, 'wb') as store:
+            store.write(cls.magic)
+            store.write(len(header).to_bytes(8, 'little'))
+            store.write(header)
+            for name, dtype in cls.columns:
+                store.seek(data_start + columns[name][0])
+                store.write(arrays[name].tobytes())
+            store.truncate(data_start + position)
+        os.replace(temp_file, store_file)
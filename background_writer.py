@@ -0,0 +1,117 @@
+import queue
+import threading
+
+
+class BackgroundWriter:
+    """
+    runs write tasks in background threads, so the parser goes on slicing while segments are encoded and written.
+    tasks wait in a bounded queue: when it is full, submit blocks until a thread is free (so memory of
+    waiting segments stays bounded). first error of a task is raised to the caller by the next submit, flush
+    or close, and later tasks are dropped.
+    tasks are grouped in batches (for example writes of one utterance), so the caller can wait for the tasks of
+    a batch only, while tasks of later batches go on.
+    """
+
+    def __init__(self, threads=2, queue_size=64):
+        """
+        :param threads: number of writing threads
+        :type threads: int
+        :param queue_size: maximal number of tasks waiting for a thread
+        :type queue_size: int
+        """
+        self.tasks = queue.Queue(queue_size)
+        self.error = None
+        self.batch = 0  # batch tasks are submitted to now
+        self.remaining = {}  # batch: number of its tasks not finished
+        self.finished = threading.Condition()
+        self.threads = [threading.Thread(target=self.run, daemon=True) for thread in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def run(self):
+        """
+        thread loop: run tasks until None task
+        """
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                function, args, batch = task
+                try:
+                    if self.error is None:
+                        function(*args)
+                finally:
+                    with self.finished:
+                        self.remaining[batch] -= 1
+                        if not self.remaining[batch]:
+                            del self.remaining[batch]
+                            self.finished.notify_all()
+            except BaseException as error:
+                if self.error is None:
+                    self.error = error
+            finally:
+                self.tasks.task_done()
+
+    def check(self):
+        """
+        raise error of failed task, if any
+        """
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, function, *args):
+        """
+        run function with given args in background thread, waiting if queue is full
+        :param function: task function
+        :type function: function pointer
+        :return: none
+        :rtype:
+        """
+        self.check()
+        with self.finished:
+            self.remaining[self.batch] = self.remaining.get(self.batch, 0) + 1
+        self.tasks.put((function, args, self.batch))
+
+    def end_batch(self):
+        """
+        end current batch, next tasks are submitted to a new batch
+        :return: ended batch, to wait for
+        :rtype: int
+        """
+        self.batch += 1
+        return self.batch - 1
+
+    def wait(self, batch):
+        """
+        wait for all tasks of batch to finish (tasks of other batches may still run)
+        :param batch: batch returned by end_batch
+        :type batch: int
+        """
+        with self.finished:
+            self.finished.wait_for(lambda: batch not in self.remaining)
+        self.check()
+
+    def flush(self):
+        """
+        wait for all submitted tasks to finish
+        """
+        self.tasks.join()
+        self.check()
+
+    def close(self):
+        """
+        finish all submitted tasks and stop threads
+        """
+        for thread in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.check()
@@ -0,0 +1,341 @@
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+
+class SyntheticCorpus:
+    """
+    generates corpus shaped as librispeech with its alignments: audio/<speaker>/<chapter>/<speaker>-<chapter>-<n>.flac
+    with transcript file in each chapter folder, and alignment/<speaker>/<chapter>/<same name>.TextGrid with words
+    and phones tiers. phones durations and vowels share are close to librispeech alignments.
+    audio is noise with tone in each phone, so flac compresses it as it compresses speech.
+    """
+    vowels = ['AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH', 'ER', 'EY', 'OW', 'OY', 'UH', 'UW', 'IH', 'IY']
+    consonants = ['B', 'CH', 'D', 'DH', 'F', 'G', 'HH', 'JH', 'K', 'L', 'M', 'N', 'NG', 'P', 'R', 'S', 'SH', 'T',
+                  'TH', 'V', 'W', 'Y', 'Z', 'ZH']
+    vowel_share = 0.38  # part of phones which are vowels
+    phone_duration = (0.03, 0.16)  # seconds
+    pause_duration = (0.05, 0.4)  # silence between words, seconds
+    phones_in_word = (2, 7)
+
+    @classmethod
+    def text_grid(cls, duration, words, phones):
+        """
+        create text grid file content
+        :param duration: utterance length in seconds
+        :type duration: float
+        :param words: (start, end, text) of each words tier interval
+        :type words: list
+        :param phones: (start, end, text) of each phones tier interval
+        :type phones: list
+        :return: text grid content (librispeech alignment format)
+        :rtype: str
+        """
+        lines = ['File type = "ooTextFile"', 'Object class = "TextGrid"', '',
+                 'xmin = 0.0', f'xmax = {duration:.3f}', 'tiers? <exists>', 'size = 2', 'item []:']
+        for number, (name, intervals) in enumerate((("words", words), ("phones", phones)), 1):
+            lines += [f'\titem [{number}]:', '\t\tclass = "IntervalTier"', f'\t\tname = "{name}"',
+                      '\t\txmin = 0.0', f'\t\txmax = {duration:.3f}', f'\t\tintervals: size = {len(intervals)}']
+            for index, (start, end, text) in enumerate(intervals, 1):
+                lines += [f'\t\t\tintervals [{index}]:', f'\t\t\t\txmin = {start:.3f}', f'\t\t\t\txmax = {end:.3f}',
+                          f'\t\t\t\ttext = "{text}"']
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def utterance(cls, generator, seconds):
+        """
+        create alignment of single utterance
+        :param generator: random generator
+        :type generator: random.Random
+        :param seconds: required length in seconds (approximately)
+        :type seconds: float
+        :return: length in seconds, words intervals, phones intervals
+        :rtype: float, list, list
+        """
+        words, phones = [], []
+        time_point = 0.0
+        while time_point < seconds:
+            # pause before word
+            pause = round(generator.uniform(*cls.pause_duration), 2)
+            words.append((time_point, time_point + pause, ""))
+            phones.append((time_point, time_point + pause, ""))
+            time_point += pause
+
+            word_start = time_point
+            for phone in range(generator.randint(*cls.phones_in_word)):
+                if generator.random() < cls.vowel_share:
+                    name = generator.choice(cls.vowels) + str(generator.choice((0, 1, 1, 2)))
+                else:
+                    name = generator.choice(cls.consonants)
+                length = round(generator.uniform(*cls.phone_duration), 2)
+                phones.append((time_point, time_point + length, name))
+                time_point += length
+            words.append((word_start, time_point, "word"))
+
+        # final silence
+        words.append((time_point, time_point + 0.2, ""))
+        phones.append((time_point, time_point + 0.2, ""))
+        return round(time_point + 0.2, 3), words, phones
+
+    @classmethod
+    def generate(cls, root, speakers=4, chapters=2, utterances=10, seconds=(10, 16), sample_rate=16000, seed=0):
+        """
+        create synthetic corpus. same arguments create same corpus.
+        :param root: folder to create audio and alignment folders in
+        :type root: str
+        :param speakers: number of speakers
+        :type speakers: int
+        :param chapters: number of chapters of each speaker
+        :type chapters: int
+        :param utterances: number of utterances in each chapter
+        :type utterances: int
+        :param seconds: utterance length range in seconds
+        :type seconds: tuple
+        :param sample_rate: audio sample rate
+        :type sample_rate: int
+        :param seed: random seed
+        :type seed: int
+        :return: audio folder, alignment folder
+        :rtype: str, str
+        """
+        import soundfile as sf
+
+        generator = random.Random(seed)
+        noise = np.random.default_rng(seed)
+        audio_path = os.path.join(root, "audio")
+        txt_path = os.path.join(root, "alignment")
+
+        for speaker in range(speakers):
+            speaker_id = str(1000 + speaker * 37)
+            for chapter in range(chapters):
+                chapter_id = str(20000 + speaker * 101 + chapter)
+                audio_folder = os.path.join(audio_path, speaker_id, chapter_id)
+                txt_folder = os.path.join(txt_path, speaker_id, chapter_id)
+                Path(audio_folder).mkdir(parents=True, exist_ok=True)
+                Path(txt_folder).mkdir(parents=True, exist_ok=True)
+
+                transcript = []
+                for number in range(utterances):
+                    utterance_id = f"{speaker_id}-{chapter_id}-{number:04d}"
+                    duration, words, phones = cls.utterance(generator, generator.uniform(*seconds))
+
+                    # noise, with tone of different frequency in each phone
+                    frames = int(round(duration * sample_rate))
+                    samples = noise.normal(0, 300, frames)
+                    for start, end, name in phones:
+                        if name:
+                            first, last = int(start * sample_rate), int(end * sample_rate)
+                            frequency = 100 + 40 * (sum(map(ord, name)) % 20)
+                            samples[first:last] += 3000 * np.sin(2 * np.pi * frequency *
+                                                                  np.arange(last - first) / sample_rate)
+                    sf.write(os.path.join(audio_folder, utterance_id + ".flac"),
+                             np.clip(samples, -32768, 32767).astype(np.int16), sample_rate, subtype="PCM_16")
+
+                    with open(os.path.join(txt_folder, utterance_id + ".TextGrid"), "w") as text_grid:
+                        text_grid.write(cls.text_grid(duration, words, phones))
+                    transcript.append(utterance_id + " " + " ".join(text for start, end, text in words if text))
+
+                with open(os.path.join(audio_folder, f"{speaker_id}-{chapter_id}.trans.txt"), "w") as trans:
+                    trans.write("\n".join(transcript) + "\n")
+
+        return audio_path, txt_path
+
+
+def folder_size(folder):
+    """
+    :param folder: folder path
+    :type folder: str
+    :return: number of wav files, total size of files in bytes
+    :rtype: int, int
+    """
+    count = size = 0
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+            count += file.endswith(".wav")
+    return count, size
+
+
+def peak_rss():
+    """
+    :return: peak resident memory of this process and its finished child processes in KB, None if not supported
+    :rtype: int
+    """
+    try:
+        import resource
+    except ImportError:
+        return None  # windows
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    try:
+        # ru_maxrss of process started by spawn keeps its parent peak (kept by exec), VmHWM doesn't
+        with open("/proc/self/status", "r") as status:
+            own = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            own, children = own // 1024, children // 1024  # bytes on mac os
+    return max(own, children)
+
+
+def run_step(step, audio_path, txt_path, dst_folder, workers, results):
+    """
+    benchmark step entry, run in new process so peak memory is of the step only
+    :param step: extract method ("by_phoneme", "by_interval", "by_count"), or "split" (split dst_folder)
+    :type step: str
+    :param results: queue to put step result in
+    :type results: multiprocessing.Queue
+    """
+    from data_to_folders import DataToFolders
+    import file_parser
+
+    random.seed(0)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        if step == "split":
+            split_folder = dst_folder + "-split"
+            DataToFolders.split_to_folders(dst_folder, DataToFolders.create_folders_for_net(split_folder),
+                                           is_balanced=False, second_extension='.wrd', workers=workers)
+            dst_folder = split_folder
+        else:
+            file_parser.main(audio_path, txt_path, dst_folder, extract_method=step, workers=workers)
+    seconds = time.perf_counter() - start
+
+    segments, size = folder_size(dst_folder)
+    results.put({'step': step, 'seconds': seconds, 'segments': segments, 'bytes_written': size,
+                 'peak_rss_kb': peak_rss()})
+
+
+def git_commit():
+    """
+    :return: current commit of the code, None if not in git repository
+    :rtype: str
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(work_folder=None, speakers=4, chapters=2, utterances=10, workers=1,
+              steps=("by_phoneme", "by_interval", "by_count", "split"), seed=0, results_file=None):
+    """
+    generate synthetic corpus and time each parsing step on it
+    :param work_folder: folder for corpus and outputs, temporary folder (deleted when done) if not given
+    :type work_folder: str
+    :param speakers: corpus speakers
+    :type speakers: int
+    :param chapters: chapters of each speaker
+    :type chapters: int
+    :param utterances: utterances in each chapter
+    :type utterances: int
+    :param workers: processes (threads in split) for each step
+    :type workers: int
+    :param steps: steps to run - extract methods, and "split" of by_interval output
+    :type steps: tuple
+    :param seed: corpus random seed
+    :type seed: int
+    :param results_file: json file to write results to
+    :type results_file: str
+    :return: results: run details, and for each step: seconds, utterances and segments per second,
+             bytes written, peak memory
+    :rtype: dict
+    """
+    temporary = work_folder is None
+    if temporary:
+        work_folder = tempfile.mkdtemp(prefix="parser-benchmark-")
+
+    try:
+        start = time.perf_counter()
+        audio_path, txt_path = SyntheticCorpus.generate(os.path.join(work_folder, "corpus"), speakers, chapters,
+                                                        utterances, seed=seed)
+        corpus = {'speakers': speakers, 'chapters': chapters, 'utterances': speakers * chapters * utterances,
+                  'seed': seed, 'audio_bytes': folder_size(audio_path)[1],
+                  'generate_seconds': time.perf_counter() - start}
+
+        context = multiprocessing.get_context("spawn")
+        step_results = []
+        for step in steps:
+            dst_folder = os.path.join(work_folder, "by_interval" if step == "split" else step)
+            if step != "split":
+                shutil.rmtree(dst_folder, ignore_errors=True)
+            shutil.rmtree(dst_folder + "-split", ignore_errors=True)
+
+            results = context.Queue()
+            process = context.Process(target=run_step,
+                                      args=(step, audio_path, txt_path, dst_folder, workers, results))
+            process.start()
+            while True:
+                try:
+                    result = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f"benchmark step {step} failed (exit code {process.exitcode})")
+            process.join()
+
+            result['utterances_per_sec'] = corpus['utterances'] / result['seconds']
+            result['segments_per_sec'] = result['segments'] / result['seconds']
+            step_results.append(result)
+            print(json.dumps(result))
+    finally:
+        if temporary:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+    report = {'commit': git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'cpus': os.cpu_count(), 'workers': workers, 'corpus': corpus, 'steps': step_results}
+    if results_file:
+        with open(results_file, "w") as results_output:
+            json.dump(report, results_output, indent=2)
+    return report
+
+
+def compare(previous_file, report):
+    """
+    print time ratio of each step against previous results file
+    :param previous_file: results file of previous run
+    :type previous_file: str
+    :param report: current results, as benchmark returns
+    :type report: dict
+    :return: previous seconds / current seconds for each step (above 1 - faster now)
+    :rtype: dict
+    """
+    with open(previous_file, "r") as previous_input:
+        previous = {step['step']: step for step in json.load(previous_input)['steps']}
+
+    speedups = {}
+    for step in report['steps']:
+        if step['step'] in previous:
+            speedups[step['step']] = previous[step['step']]['seconds'] / step['seconds']
+            print(f"{step['step']}: {previous[step['step']]['seconds']:.2f}s -> {step['seconds']:.2f}s "
+                  f"({speedups[step['step']]:.2f}x)")
+    return speedups
+
+
+if __name__ == '__main__':
+    # corpus size: speakers x chapters x utterances (librispeech chapter has about 100 utterances)
+    corpus_speakers = 4
+    corpus_chapters = 2
+    chapter_utterances = 10
+    benchmark_workers = 1
+    # results of this run, and results of previous run to compare with (None to skip)
+    benchmark_results_file = "benchmark_results.json"
+    previous_results_file = None
+
+    benchmark_report = benchmark(speakers=corpus_speakers, chapters=corpus_chapters, utterances=chapter_utterances,
+                                 workers=benchmark_workers, results_file=benchmark_results_file)
+    if previous_results_file:
+        compare(previous_results_file, benchmark_report)
@@ -0,0 +1,197 @@
+import json
+import os
+import wave
+
+
+class CorpusIndex:
+    """
+    index of corpus audio files paired with their text grid alignment files, built in a single
+    os.scandir pass over each tree. for each utterance it keeps: utterance id, audio and text grid paths,
+    audio size, modification time, sample rate and frames count (from the audio header).
+    utterances are in the order the parser goes over them (sorted, folder files before sub folders).
+    if index file is given, the index is saved to it, and next scans read headers only of audio files
+    which were added or changed (by modification time and size). without index file, headers may be
+    read only when needed (see info).
+    """
+    version = 1
+    audio_extensions = ('.flac', '.wav')
+    txt_extension = '.TextGrid'
+
+    def __init__(self, audio_path, txt_path, index_file=None, read_headers=True):
+        """
+        scan corpus, using previous index file if exists
+        :param audio_path: audio root path folder
+        :type audio_path: str
+        :param txt_path: text grid alignment root path folder (same tree as audio)
+        :type txt_path: str
+        :param index_file: json file to keep index in, None to scan without saving
+        :type index_file: str
+        :param read_headers: indicates if to read audio headers while scanning (always read if index file given)
+        :type read_headers: bool
+        """
+        self.audio_path = audio_path
+        self.txt_path = txt_path
+
+        previous = {}
+        if index_file and os.path.exists(index_file):
+            with open(index_file, "r") as index:
+                header = json.load(index)
+            if header.get('version') == self.version and header['audio_path'] == audio_path:
+                previous = {utterance['audio']: utterance for utterance in header['utterances']}
+
+        # text grid files by related path without extension
+        txt_files = {}
+        for relative_path, entries, dirs in self.scan(txt_path):
+            for entry in entries:
+                name, extension = os.path.splitext(entry.name)
+                if extension == self.txt_extension:
+                    txt_files[os.path.join(relative_path, name)] = entry.path
+
+        self.utterances = []  # dict for each paired audio file, in parsing order
+        # [related folder path, files count, first utterance, utterances end] for each audio folder
+        self.folders = []
+        self.unpaired_audio = []  # audio files without text grid
+        self.audio_counts = dict.fromkeys(self.audio_extensions, 0)  # audio files count by extension
+        headers_read = 0
+
+        for relative_path, entries, dirs in self.scan(audio_path):
+            first = len(self.utterances)
+            for entry in entries:
+                name, extension = os.path.splitext(entry.name)
+                if extension not in self.audio_counts:
+                    continue
+                self.audio_counts[extension] += 1
+
+                key = os.path.join(relative_path, name)
+                txt_file = txt_files.pop(key, None)
+                if txt_file is None:
+                    self.unpaired_audio.append(entry.path)
+                    continue
+
+                stat = entry.stat()
+                audio = os.path.join(relative_path, entry.name)
+                utterance = previous.get(audio)
+                if utterance is None or utterance['size'] != stat.st_size or \
+                        utterance['mtime_ns'] != stat.st_mtime_ns:
+                    utterance = {'id': name, 'audio': audio, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                 'sample_rate': None, 'frames': None}
+                    if read_headers or index_file:
+                        self.read_header(entry.path, utterance)
+                        headers_read += 1
+                utterance['audio_file'] = entry.path
+                utterance['txt_file'] = txt_file
+                self.utterances.append(utterance)
+            self.folders.append([relative_path, len(entries), first, len(self.utterances)])
+
+        self.unpaired_txt = sorted(txt_files.values())  # text grid files without audio
+        self.by_audio_file = {utterance['audio_file']: utterance for utterance in self.utterances}
+
+        if index_file:
+            self.save(index_file)
+        if self.unpaired_audio or self.unpaired_txt:
+            print(f"{len(self.unpaired_audio)} audio files without text grid, "
+                  f"{len(self.unpaired_txt)} text grid files without audio")
+        if index_file:
+            print(f"corpus index: {len(self.utterances)} utterances, {headers_read} audio headers read")
+
+    def __len__(self):
+        return len(self.utterances)
+
+    def __contains__(self, audio_file):
+        return audio_file in self.by_audio_file
+
+    @classmethod
+    def scan(cls, root):
+        """
+        go over folder tree with os.scandir, sorted, each folder before its sub folders (as os.walk)
+        :param root: root folder
+        :type root: str
+        :return: generator of (path related to root, files entries, sub folders entries) for each folder
+        :rtype: generator
+        """
+        stack = [(root, "")]
+        while stack:
+            folder, relative_path = stack.pop()
+            with os.scandir(folder) as scanner:
+                entries = sorted(scanner, key=lambda entry: entry.name)
+            files = [entry for entry in entries if not entry.is_dir()]
+            dirs = [entry for entry in entries if entry.is_dir()]
+            yield relative_path, files, dirs
+            # symbolic links to folders are not followed, as os.walk
+            stack.extend((entry.path, os.path.join(relative_path, entry.name))
+                         for entry in reversed(dirs) if not entry.is_symlink())
+
+    @classmethod
+    def count_audio_files(cls, audio_path):
+        """
+        count audio files without pairing them
+        :param audio_path: audio root path folder
+        :type audio_path: str
+        :return: audio files count by extension
+        :rtype: dict
+        """
+        counts = dict.fromkeys(cls.audio_extensions, 0)
+        for relative_path, entries, dirs in cls.scan(audio_path):
+            for entry in entries:
+                extension = os.path.splitext(entry.name)[1]
+                if extension in counts:
+                    counts[extension] += 1
+        return counts
+
+    def matches(self, audio_path, txt_path):
+        """
+        :return: True if index is of given folders
+        :rtype: bool
+        """
+        return self.audio_path == audio_path and self.txt_path == txt_path
+
+    def folder_pairs(self):
+        """
+        pairs of audio and text grid files, as FileParser.folder_pairs
+        :return: generator of (files count in folder, list of [audio file, text grid file]) for each folder
+        :rtype: generator
+        """
+        for relative_path, files_count, first, end in self.folders:
+            yield files_count, [[utterance['audio_file'], utterance['txt_file']]
+                                for utterance in self.utterances[first:end]]
+
+    @classmethod
+    def read_header(cls, audio_file, utterance):
+        """
+        set utterance sample rate and frames count from audio file header
+        """
+        if audio_file.endswith('.wav'):
+            try:
+                with wave.open(audio_file, 'rb') as wav_file:
+                    utterance['sample_rate'] = wav_file.getframerate()
+                    utterance['frames'] = wav_file.getnframes()
+                    return
+            except (wave.Error, EOFError):
+                pass  # format wave module doesn't read
+
+        import soundfile as sf
+        info = sf.info(audio_file)
+        utterance['sample_rate'] = info.samplerate
+        utterance['frames'] = info.frames
+
+    def info(self, audio_file):
+        """
+        :param audio_file: audio file path, as in pairs
+        :type audio_file: str
+        :return: sample rate, frames count
+        :rtype: int, int
+        """
+        utterance = self.by_audio_file[audio_file]
+        if utterance['frames'] is None:
+            self.read_header(audio_file, utterance)
+        return utterance['sample_rate'], utterance['frames']
+
+    def save(self, index_file):
+        """
+        write index to json file, replacing existing file only when done
+        """
+        utterances = [{key: value for key, value in utterance.items() if key not in ('audio_file', 'txt_file')}
+                      for utterance in self.utterances]
+        with open(index_file + ".tmp", "w") as index:
+            json.dump({'version': self.version, 'audio_path': self.audio_path, 'utterances': utterances}, index)
+        os.replace(index_file + ".tmp", index_file)
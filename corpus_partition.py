@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+class CorpusPartition:
+    """
+    deterministic partition of corpus utterances to independent nodes, so each node parses its part
+    to its own destination folder, sharing only the input folders.
+    utterances are assigned by hash of speaker id (all utterances of a speaker on same node), or of
+    utterance id, so any node computes the same partition without communicating.
+    merge combines the nodes destination folders to one, renumbering each label files after the files of
+    previous nodes, with label counters and catalog updated to the new names.
+    """
+    partition_keys = ("speaker", "utterance")
+    skip_folders = (".staging", "converted_wav")
+
+    def __init__(self, shard_index, num_shards, by="speaker"):
+        """
+        :param shard_index: index of this node part, from 0
+        :type shard_index: int
+        :param num_shards: number of parts
+        :type num_shards: int
+        :param by: "speaker" or "utterance"
+        :type by: str
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard index {shard_index} not in range of {num_shards} shards")
+        if by not in self.partition_keys:
+            raise ValueError(f"unknown partition key {by}")
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        self.by = by
+
+    def __contains__(self, audio_file):
+        return self.shard_of(audio_file) == self.shard_index
+
+    def __repr__(self):
+        return f"{self.shard_index + 1} of {self.num_shards} shards by {self.by}"
+
+    def shard_of(self, audio_file):
+        """
+        :param audio_file: utterance audio file path (librispeech name: speaker-chapter-utterance)
+        :type audio_file: str
+        :return: index of part utterance belongs to
+        :rtype: int
+        """
+        utterance = os.path.splitext(os.path.basename(audio_file))[0]
+        key = utterance.split("-")[0] if self.by == "speaker" else utterance
+        # not hash(), which differs between processes
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big") % self.num_shards
+
+    @classmethod
+    def numbered_files(cls, folder_path):
+        """
+        :param folder_path: label folder of parser output
+        :type folder_path: str
+        :return: file names of each file number (wav, wrd, features), sorted by number
+        :rtype: list of (int, list of str)
+        """
+        numbers = {}
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                number = entry.name.split(".")[0]
+                if number.isdigit() and entry.is_file():
+                    numbers.setdefault(int(number), []).append(entry.name)
+        return sorted(numbers.items())
+
+    @classmethod
+    def merge(cls, node_folders, dst_folder, link_mode="copy", workers=1):
+        """
+        combine destination folders of nodes to single destination folder (which may hold files already).
+        files of each label are numbered in nodes order, after files already in the label folder.
+        catalogs are combined with new paths, features indexes (see segment_features.py) with new names.
+        the result can be split by DataToFolders as if parsed by single run.
+        :param node_folders: destination folder of each node, in shard index order
+        :type node_folders: list of str
+        :param dst_folder: folder to combine to
+        :type dst_folder: str
+        :param link_mode: "copy", or "hardlink" / "symlink" / "reflink" to place files without copying data
+        :type link_mode: str
+        :param workers: number of copying threads
+        :type workers: int
+        :return: number of segments (numbered files) placed
+        :rtype: int
+        """
+        from data_to_folders import DataToFolders
+        from file_parser import FileParser
+        from segment_catalog import SegmentCatalog
+        from shard_writer import ShardWriter
+
+        Path(dst_folder).mkdir(parents=True, exist_ok=True)
+        next_numbers = {}  # label: next file number in destination
+        catalog = None
+        features = {}  # features index file name: index content (see SegmentFeatures.update)
+        placed = 0
+
+        for node_folder in node_folders:
+            if os.path.exists(os.path.join(node_folder, ShardWriter.index_file_name)):
+                raise ValueError("segments in shards can not be merged")
+
+            names = {}  # segment name in node folder (label/number): name in destination
+            file_pairs = []
+            with os.scandir(node_folder) as labels:
+                labels = sorted(entry.name for entry in labels
+                                if entry.is_dir() and entry.name not in cls.skip_folders)
+            for label in labels:
+                label_folder = DataToFolders.create_sub_folder(dst_folder, label)
+                if label not in next_numbers:
+                    next_numbers[label] = FileParser.read_counter(label_folder)
+                for number, file_names in cls.numbered_files(os.path.join(node_folder, label)):
+                    new_number = next_numbers[label]
+                    next_numbers[label] += 1
+                    names[f"{label}/{number}"] = f"{label}/{new_number}"
+                    for file_name in file_names:
+                        # same extension (.wav, .wrd, .<features tag>.npy) with new number
+                        new_name = str(new_number) + file_name[len(str(number)):]
+                        file_pairs.append((os.path.join(node_folder, label, file_name),
+                                           os.path.join(label_folder, new_name)))
+            DataToFolders.place_files(file_pairs, link_mode, workers)
+            placed += len(names)
+
+            node_catalog = os.path.join(node_folder, SegmentCatalog.file_name)
+            if os.path.exists(node_catalog):
+                if catalog is None:
+                    catalog = SegmentCatalog(dst_folder)
+                with SegmentCatalog(node_catalog) as node_rows:
+                    rows = node_rows.rows()
+                for row in rows:
+                    row['path'] = cls.renamed(names, row['path'])
+                    row['wrd'] = cls.renamed(names, row['wrd'])
+                catalog.add_rows(rows)
+
+            for file_name in sorted(os.listdir(node_folder)):
+                if file_name.startswith("features-") and file_name.endswith(".json"):
+                    with open(os.path.join(node_folder, file_name), "r") as index:
+                        node_index = json.load(index)
+                    if file_name not in features:
+                        features[file_name] = cls.read_index(os.path.join(dst_folder, file_name), node_index)
+                    features[file_name]['segments'].update({names[name]: entry for name, entry
+                                                            in node_index['segments'].items() if name in names})
+
+        for label, next_number in next_numbers.items():
+            FileParser.write_counter(os.path.join(dst_folder, label), next_number)
+        if catalog is not None:
+            catalog.close()
+        for file_name, index_content in features.items():
+            with open(os.path.join(dst_folder, file_name), "w") as index:
+                json.dump(index_content, index)
+
+        print(f"{placed} segments of {len(node_folders)} nodes merged to {dst_folder}")
+        return placed
+
+    @classmethod
+    def read_index(cls, index_file, node_index):
+        """
+        :param index_file: features index file in destination folder
+        :type index_file: str
+        :param node_index: features index of node
+        :type node_index: dict
+        :return: features index in destination folder, empty (with node parameters) if not exists
+        :rtype: dict
+        """
+        if os.path.exists(index_file):
+            with open(index_file, "r") as index:
+                return json.load(index)
+        return {'params': node_index['params'], 'segments': {}}
+
+    @classmethod
+    def renamed(cls, names, path):
+        """
+        :param names: segment names in node folder: names in destination
+        :type names: dict
+        :param path: file path related to node folder (label/number.extension), or None
+        :type path: str
+        :return: file path related to destination folder
+        :rtype: str
+        """
+        if path is None:
+            return None
+        name, extension = os.path.splitext(path)
+        return names[name] + extension
+
+
+if __name__ == '__main__':
+    # destination folders of the nodes (parsed with corpus_part_index 0, 1, ... in file_parser.py)
+    nodes_destinations = [os.path.join("sample_data_libriSpeech", f"parsed-by-interval-part{index}")
+                          for index in range(2)]
+    merged_destination = os.path.join("sample_data_libriSpeech", "parsed-by-interval")
+    # "hardlink" to merge without copying files data (nodes folders and destination on same disk)
+    merge_link_mode = "copy"
+    copy_workers = 8
+
+    CorpusPartition.merge(nodes_destinations, merged_destination, merge_link_mode, copy_workers)
@@ -1,11 +1,19 @@
+import csv
 import random
 from pathlib import Path
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from shutil import copyfile
 import ntpath
 
 
 class DataToFolders:
+    # how split files are placed in destination: "copy", or "hardlink" / "symlink" / "reflink",
+    # which take no extra space (falling back to copy where file system doesn't support it)
+    link_modes = ("copy", "hardlink", "symlink", "reflink")
+    split_names = ("train", "valid", "test")
+    FICLONE = 0x40049409  # linux ioctl cloning file data (btrfs, xfs)
 
     @staticmethod
     def create_sub_folder(root, sub_folder):
@@ -18,7 +26,7 @@ class DataToFolders:
         :return: new combined path
         :rtype: str
         """
-        new_path = root + "\\" + sub_folder
+        new_path = os.path.join(root, sub_folder)
         Path(new_path).mkdir(parents=True, exist_ok=True)
         return new_path
 
@@ -52,19 +60,20 @@ class DataToFolders:
         """
         file_list = []
         for root, dirs, files in os.walk(root_folder):  # go over root folder
-            file_list.extend([os.path.join(root, file) for file in files if file.endswith(extension)])
+            names = set(files)
+            for file in files:
+                if not file.endswith(extension):
+                    continue
+                if not extension_second:
+                    file_list.append(os.path.join(root, file))
+                    continue
 
-        if not extension_second:
-            return file_list
+                # search for same name file in same path, which has second type
+                paired = file[:-len(extension)] + extension_second
+                if paired in names:
+                    file_list.append([os.path.join(root, file), os.path.join(root, paired)])
 
-        paired_list = []
-        for file in file_list:
-            # search for same name file in same path, which has second type
-            paired = file.replace(extension, extension_second)
-            if os.path.exists(paired):
-                paired_list.append([file, paired])
-
-        return paired_list
+        return file_list
 
     @staticmethod
     def get_min_count_files(root_folder, extension):
@@ -81,7 +90,7 @@ class DataToFolders:
         min_count = sys.maxsize
 
         for sub_folder in os.listdir(root_folder):
-            full_path = os.path.join(source_path, sub_folder)
+            full_path = os.path.join(root_folder, sub_folder)
             if os.path.isdir(full_path):
                 # get amount of files
                 total = len(DataToFolders.get_files(full_path, extension))
@@ -90,51 +99,142 @@ class DataToFolders:
         return min_count
 
     @staticmethod
-    def copy_files_paired(paired_file_list, dst_folder):
+    def reflink(src, dst):
+        """
+        create dst sharing src data blocks (copy on write), supported by btrfs and xfs on linux
+        :param src: source file path
+        :type src: str
+        :param dst: destination file path
+        :type dst: str
+        :return: none
+        :rtype:
+        """
+        import fcntl  # not available on windows - caller falls back to copy
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            fcntl.ioctl(dst_file.fileno(), DataToFolders.FICLONE, src_file.fileno())
+
+    @staticmethod
+    def place_file(src, dst, link_mode="copy"):
+        """
+        place file in destination by copy or link, falling back to copy if link fails
+        :param src: source file path
+        :type src: str
+        :param dst: destination file path
+        :type dst: str
+        :param link_mode: one of link_modes
+        :type link_mode: str
+        :return: none
+        :rtype:
+        """
+        if link_mode not in DataToFolders.link_modes:
+            raise ValueError(f"unknown link mode {link_mode}")
+
+        # replace existing file (link to it would be written through otherwise)
+        if os.path.lexists(dst):
+            os.remove(dst)
+
+        if link_mode != "copy":
+            try:
+                if link_mode == "hardlink":
+                    os.link(src, dst)
+                elif link_mode == "symlink":
+                    os.symlink(os.path.abspath(src), dst)
+                else:
+                    DataToFolders.reflink(src, dst)
+                return
+            except (OSError, ImportError):
+                # other device, or not supported by file system
+                if os.path.lexists(dst):
+                    os.remove(dst)
+
+        copyfile(src, dst)
+
+    @staticmethod
+    def place_files(file_pairs, link_mode="copy", workers=1):
+        """
+        place files by place_file, using threads pool if more than one worker
+        :param file_pairs: (source path, destination path) pairs
+        :type file_pairs: iterable
+        :param link_mode: one of link_modes
+        :type link_mode: str
+        :param workers: number of threads
+        :type workers: int
+        :return: none
+        :rtype:
+        """
+        if workers <= 1:
+            for src, dst in file_pairs:
+                DataToFolders.place_file(src, dst, link_mode)
+            return
+
+        with ThreadPoolExecutor(workers) as executor:
+            pending = deque()
+            for src, dst in file_pairs:
+                pending.append(executor.submit(DataToFolders.place_file, src, dst, link_mode))
+                # keep bounded number of pending files, raising errors as they happen
+                if len(pending) > 4 * workers:
+                    pending.popleft().result()
+            while pending:
+                pending.popleft().result()
+
+    @staticmethod
+    def destination_pairs(file_list, dst_folder, paired=False):
+        """
+        get source and destination path of each file copied to given folder
+        :param file_list: list of file paths, or of paired paths
+        :type file_list: list
+        :param dst_folder: folder to copy files to
+        :type dst_folder: str
+        :param paired: indicates if file list items are paired paths (both files are copied)
+        :type paired: bool
+        :return: (source path, destination path) pairs
+        :rtype: generator
+        """
+        for item in file_list:
+            for src in (item[:2] if paired else (item,)):
+                yield src, os.path.join(dst_folder, ntpath.basename(src))
+
+    @staticmethod
+    def copy_files_paired(paired_file_list, dst_folder, link_mode="copy", workers=1):
         """
         copy paired items
         :param paired_file_list: list of paired paths
         :type paired_file_list: list of lists of str
         :param dst_folder: destination path
         :type dst_folder: str
+        :param link_mode: one of link_modes
+        :type link_mode: str
+        :param workers: number of copying threads
+        :type workers: int
         :return: none
         :rtype:
         """
-
-        for paired in paired_file_list:
-            # get two files
-            first_src = paired[0]
-            second_src = paired[1]
-
-            # create destination file path + name
-            first_dst = dst_folder + "\\" + ntpath.basename(first_src)
-            second_dst = dst_folder + "\\" + ntpath.basename(second_src)
-
-            # copy the files
-            copyfile(first_src, first_dst)
-            copyfile(second_src, second_dst)
+        # create destination file path + name for the two files
+        DataToFolders.place_files(DataToFolders.destination_pairs(paired_file_list, dst_folder, True),
+                                  link_mode, workers)
 
     @staticmethod
-    def copy_files(file_list, dst_folder):
+    def copy_files(file_list, dst_folder, link_mode="copy", workers=1):
         """
         copy list of files to given folder
         :param file_list: list of file paths
         :type file_list: list of str
         :param dst_folder: folder to copy files to
         :type dst_folder: str
+        :param link_mode: one of link_modes
+        :type link_mode: str
+        :param workers: number of copying threads
+        :type workers: int
         :return: none
         :rtype:
         """
-
-        for file in file_list:
-            # create destination file path = path + file name
-            file_dst = dst_folder + "\\" + ntpath.basename(file)
-            copyfile(file, file_dst)
+        # create destination file path = path + file name
+        DataToFolders.place_files(DataToFolders.destination_pairs(file_list, dst_folder), link_mode, workers)
 
     @staticmethod
     def split_to_folders(source_root, dst_root_list,
                                 first_split=0.8, second_split=0.1, is_balanced=True,
-                                extension=".wav", second_extension=None):
+                                extension=".wav", second_extension=None, link_mode="copy", workers=1):
         """
         This function splits files in root to three destinations, while saving folders hierarchy
         :param source_root: root folder
@@ -152,63 +252,160 @@ class DataToFolders:
         :type extension: str
         :param second_extension: second type to move (same name needed different extension)
         :type second_extension: str
+        :param link_mode: "copy", or "hardlink" / "symlink" / "reflink" to place files without copying data
+        :type link_mode: str
+        :param workers: number of copying threads
+        :type workers: int
         :return: none
         :rtype:
         """
 
-        # create balanced division
-        if is_balanced:
-            # get smallest folder count of files
-            min_count = DataToFolders.get_min_count_files(source_root, extension)
-            # set split intervals
-            first_split = round(min_count * first_split)
-            second_split = first_split + round(min_count * second_split)
-            third_split = min_count
-
         # check if needed to copy one or two type of files
-        copy_method = DataToFolders.copy_files
-        if second_extension:
-            copy_method = DataToFolders.copy_files_paired
+        paired = bool(second_extension)
 
-        for path in os.listdir(source_root):
-
-            full_path = os.path.join(source_path, path)
+        # get files of each folder once
+        folders = {}
+        for path in sorted(os.listdir(source_root)):
+            full_path = os.path.join(source_root, path)
             if os.path.isdir(full_path):
+                folders[path] = DataToFolders.get_files(full_path, extension, second_extension)
+
+        # create balanced division - use smallest folder count of files
+        min_count = min((len(file_list) for file_list in folders.values()), default=0)
+
+        # files of all folders and parts are placed together, by single threads pool
+        file_pairs = []
+        for path, file_list in folders.items():
+            random.shuffle(file_list)
+
+            # get intervals according to count of files (smallest folder or current folder)
+            count = min_count if is_balanced else len(file_list)
+            first_end, second_end = DataToFolders.split_points(count, first_split, second_split)
+
+            # divide file list according to intervals
+            # train
+            first_part = file_list[0: first_end]
+            # validation
+            second_part = file_list[first_end: second_end]
+            # test
+            third_part = file_list[second_end: count]
+
+            # create in each folder sub folder with current name to keep hierarchy
+            dst_first_part = DataToFolders.create_sub_folder(dst_root_list[0], path)
+            dst_second_part = DataToFolders.create_sub_folder(dst_root_list[1], path)
+            dst_third_part = DataToFolders.create_sub_folder(dst_root_list[2], path)
+
+            # copy each files interval to suitable destination
+            file_pairs.extend(DataToFolders.destination_pairs(first_part, dst_first_part, paired))
+            file_pairs.extend(DataToFolders.destination_pairs(second_part, dst_second_part, paired))
+            file_pairs.extend(DataToFolders.destination_pairs(third_part, dst_third_part, paired))
+
+        DataToFolders.place_files(file_pairs, link_mode, workers)
+
+    @staticmethod
+    def split_points(count, first_split, second_split):
+        """
+        :param count: number of files to split
+        :type count: int
+        :param first_split: first part fraction size
+        :type first_split: float < 1
+        :param second_split: second part fraction size
+        :type second_split: float < 1
+        :return: first part end, second part end (third part ends at count)
+        :rtype: int, int
+        """
+        first_end = round(count * first_split)
+        return first_end, first_end + round(count * second_split)
+
+    @staticmethod
+    def split_catalog(catalog_file, dst_root, first_split=0.8, second_split=0.1, is_balanced=True, seed=None,
+                      materialize=False, link_mode="copy", workers=1):
+        """
+        split segments listed in parser catalog (see segment_catalog.py) to train, valid and test,
+        without going over the parsed files. writes split manifest for each part: <part>.csv in dst_root,
+        listing its segments (catalog fields, paths related to catalog folder).
+        :param catalog_file: catalog file, or parser destination folder containing it
+        :type catalog_file: str
+        :param dst_root: folder for split manifests (and split files)
+        :type dst_root: str
+        :param first_split: first part fraction size
+        :type first_split: float < 1
+        :param second_split: second part fraction size
+        :type second_split: float < 1
+        :param is_balanced: indicates if to split so that each label will have same count of segments
+                (smallest label count), otherwise each label is split by its own count (stratified)
+        :type is_balanced: bool
+        :param seed: random seed, for same split on every run
+        :type seed: int
+        :param materialize: indicates if to also place the files in dst_root/<part>/<label> folders
+        :type materialize: bool
+        :param link_mode: "copy", or "hardlink" / "symlink" / "reflink" to place files without copying data
+        :type link_mode: str
+        :param workers: number of copying threads
+        :type workers: int
+        :return: segments of each part
+        :rtype: dict of list of dict
+        """
+        from segment_catalog import SegmentCatalog
+
+        with SegmentCatalog(catalog_file) as catalog:
+            source_root = os.path.dirname(os.path.abspath(catalog.catalog_file))
+            rows = catalog.rows()
+
+        labels = {}
+        for row in rows:
+            labels.setdefault(row['label'], []).append(row)
+        min_count = min((len(label_rows) for label_rows in labels.values()), default=0)
+
+        generator = random.Random(seed)
+        parts = {name: [] for name in DataToFolders.split_names}
+        for label in sorted(labels):
+            label_rows = labels[label]
+            generator.shuffle(label_rows)
+            count = min_count if is_balanced else len(label_rows)
+            first_end, second_end = DataToFolders.split_points(count, first_split, second_split)
+            parts["train"].extend(label_rows[0: first_end])
+            parts["valid"].extend(label_rows[first_end: second_end])
+            parts["test"].extend(label_rows[second_end: count])
+
+        Path(dst_root).mkdir(parents=True, exist_ok=True)
+        for name, part_rows in parts.items():
+            with open(os.path.join(dst_root, name + ".csv"), "w", newline="") as manifest:
+                writer = csv.DictWriter(manifest, SegmentCatalog.fields)
+                writer.writeheader()
+                writer.writerows(part_rows)
+
+        if materialize:
+            file_pairs = []
+            for name, part_rows in parts.items():
+                for row in part_rows:
+                    if row['shard']:
+                        raise ValueError("segments in shards can only be split to manifests")
+                    dst_folder = DataToFolders.create_sub_folder(os.path.join(dst_root, name), row['label'])
+                    for path in (row['path'], row['wrd']):
+                        if path:
+                            file_pairs.append((os.path.join(source_root, path),
+                                               os.path.join(dst_folder, ntpath.basename(path))))
+            DataToFolders.place_files(file_pairs, link_mode, workers)
+
+        return parts
+
+
+if __name__ == '__main__':
+    source_path = os.path.join("sample_data_libriSpeech", "parsed-by-interval")
+    dst_path = os.path.join("sample_data_libriSpeech", "parsed-by-interval-div")
+
+    # "hardlink" to split without copying files data (source and destination on same disk)
+    split_link_mode = "copy"
+    copy_workers = 8
 
-                # get files
-                file_list = DataToFolders.get_files(full_path, extension, second_extension)
-                random.shuffle(file_list)
-
-                if not is_balanced:
-                    # get intervals according to count of files in current folder
-                    current_count = len(file_list)
-                    first_split = round(current_count * first_split)
-                    second_split = first_split + round(current_count * second_split)
-                    third_split = current_count
-
-                # divide file list according to intervals
-                # train
-                first_part = file_list[0: first_split]
-                # validation
-                second_part = file_list[first_split: second_split]
-                # test
-                third_part = file_list[second_split: third_split]
-
-                # create in each folder sub folder with current name to keep hierarchy
-                dst_first_part = DataToFolders.create_sub_folder(dst_root_list[0], path)
-                dst_second_part = DataToFolders.create_sub_folder(dst_root_list[1], path)
-                dst_third_part = DataToFolders.create_sub_folder(dst_root_list[2], path)
-
-                # copy each files interval to suitable destination
-                copy_method(first_part, dst_first_part)
-                copy_method(second_part, dst_second_part)
-                copy_method(third_part, dst_third_part)
-
-
-source_path = "sample_data_libriSpeech/parsed-by-interval"
-dst_path = "sample_data_libriSpeech/parsed-by-interval-div"
-
-dst_list = DataToFolders.create_folders_for_net(dst_path)
-DataToFolders.split_to_folders(source_path, dst_list, second_extension='.wrd')
-# if no wrd - un comment this:
-#DataToFolders.split_to_folders(source_path, dst_list)
+    if os.path.exists(os.path.join(source_path, "catalog.sqlite")):
+        # split by catalog the parser created - writes train.csv, valid.csv, test.csv and places the files
+        DataToFolders.split_catalog(source_path, dst_path, materialize=True,
+                                    link_mode=split_link_mode, workers=copy_workers)
+    else:
+        dst_list = DataToFolders.create_folders_for_net(dst_path)
+        DataToFolders.split_to_folders(source_path, dst_list, second_extension='.wrd',
+                                       link_mode=split_link_mode, workers=copy_workers)
+        # if no wrd - un comment this:
+        #DataToFolders.split_to_folders(source_path, dst_list, link_mode=split_link_mode, workers=copy_workers)
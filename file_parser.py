@@ -1,37 +1,58 @@
-import glob
+import io
 import os
-from os.path import exists
-from os import makedirs
+import re
+import threading
+import time
+import wave
+from math import gcd
 from pathlib import Path
-import soundfile as sf
-from pydub import AudioSegment
-import librosa
+import numpy as np
+from background_writer import BackgroundWriter
+from corpus_index import CorpusIndex
+from parse_stats import ParseStats
+
+# text grid tier size, and interval values (xmin, xmax, text without quotes)
+SIZE_PATTERN = re.compile(r'size = (\d+)')
+VALUE_PATTERN = re.compile(r'= "?([^"\n]*)')
+# utterance measures are updated by parser and writer threads
+MEASURES_LOCK = threading.Lock()
 
 
 class AudioFileConverter:
 
+    block_frames = 65536  # frames converted at a time
+
     @classmethod
-    def convert_to_wav(cls, src_file_path, dst_path):
+    def convert_to_wav(cls, src_file_path, dst_path, block_frames=None):
         """
-        converting audio file to wav five
+        converting audio file to wav five, as 16 bit pcm.
+        the file is read and written in blocks of 16 bit samples, so memory stays the same for any file length
         :param src_file_path: file to convert
         :type src_file_path: string
         :param dst_path: file path and name to save converted file to
         :type dst_path: string
+        :param block_frames: frames to read and write at a time, default AudioFileConverter.block_frames
+        :type block_frames: int
         :return: none
         :rtype:
         """
-        data, sample_rate = sf.read(src_file_path)
-        sf.write(dst_path, data, sample_rate, format="wav")
+        import soundfile as sf
+        with sf.SoundFile(src_file_path) as src_file:
+            with sf.SoundFile(dst_path, "w", src_file.samplerate, src_file.channels, subtype="PCM_16",
+                              format="WAV") as dst_file:
+                for block in src_file.blocks(block_frames or cls.block_frames, dtype='int16'):
+                    dst_file.write(block)
 
     @classmethod
-    def folder_flac_to_wav(cls, audio_files_path, destination_path):
+    def folder_flac_to_wav(cls, audio_files_path, destination_path, block_frames=None):
         """
         convert folder tree to same tree, but change each .flac with .wav
         :param audio_files_path: root tree path
         :type audio_files_path: string
         :param destination_path: new tree path
         :type destination_path: string
+        :param block_frames: frames to convert at a time, default AudioFileConverter.block_frames
+        :type block_frames: int
         :return: none
         :rtype:
         """
@@ -48,7 +69,7 @@ class AudioFileConverter:
                 # create wav file path
                 dst_path_current = dst_path_current.replace("flac", "wav")
                 # convert to wav
-                AudioFileConverter.convert_to_wav(audio_flac_path, dst_path_current)
+                AudioFileConverter.convert_to_wav(audio_flac_path, dst_path_current, block_frames)
 
     @classmethod
     def delete_wav_files(cls, path, delete_root=True):
@@ -70,21 +91,358 @@ class AudioFileConverter:
             shutil.rmtree(path)
 
 
+class AudioBuffer:
+    """
+    audio file decoded once into 16-bit samples, so a single utterance can be cut many times
+    by sample offsets without decoding it again.
+    cuts follow pydub milli seconds slicing rules, so exported files are byte-identical
+    to the ones AudioSegment creates.
+    """
+    sample_width = 2  # 16 bit pcm
+    silence_frame_rate = 11025  # AudioSegment.silent default frame rate
+
+    def __init__(self, samples, sample_rate):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.channels = 1 if samples.ndim == 1 else samples.shape[1]
+
+    @classmethod
+    def from_file(cls, audio_file):
+        """
+        decode audio file to memory
+        :param audio_file: audio file path
+        :type audio_file: str
+        :return: decoded audio
+        :rtype: AudioBuffer
+        """
+        samples, sample_rate = cls.read_wav(audio_file)
+        if samples is None:
+            import soundfile as sf  # flac, or wav which is not 16 bit pcm
+            samples, sample_rate = sf.read(audio_file, dtype='int16')
+        return cls(samples, sample_rate)
+
+    @classmethod
+    def read_wav(cls, audio_file):
+        """
+        read 16 bit pcm wav file with wave module, without loading codecs library
+        :param audio_file: audio file path
+        :type audio_file: str
+        :return: samples (read only), sample rate. None, None if not 16 bit pcm wav file
+        :rtype: numpy.ndarray, int
+        """
+        if not audio_file.endswith('.wav'):
+            return None, None
+        try:
+            with wave.open(audio_file, 'rb') as wav_file:
+                if wav_file.getsampwidth() != cls.sample_width:
+                    return None, None
+                channels = wav_file.getnchannels()
+                samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+                sample_rate = wav_file.getframerate()
+        except (wave.Error, EOFError):
+            return None, None  # format wave module doesn't read (float, extensible header)
+        if channels > 1:
+            samples = samples.reshape(-1, channels)
+        return samples, sample_rate
+
+    @classmethod
+    def load(cls, audio):
+        """
+        get decoded audio from audio file path, or the given buffer if already decoded
+        :param audio: audio file path or decoded audio
+        :type audio: str or AudioBuffer
+        :return: decoded audio
+        :rtype: AudioBuffer
+        """
+        if isinstance(audio, AudioBuffer):
+            return audio
+        return cls.from_file(audio)
+
+    def duration(self):
+        """
+        :return: audio length in milli seconds
+        :rtype: float
+        """
+        return float(len(self.samples)) / self.sample_rate * 1000
+
+    def position(self, milli_seconds):
+        """
+        convert time to sample offset, same as AudioSegment slicing
+        :param milli_seconds: time from audio start
+        :type milli_seconds: float
+        :return: sample offset
+        :rtype: int
+        """
+        return AudioBuffer.frame_position(milli_seconds, len(self.samples), self.sample_rate)
+
+    @classmethod
+    def frame_position(cls, milli_seconds, frames, sample_rate):
+        """
+        convert time to sample offset in audio of given length, same as AudioSegment slicing
+        :param milli_seconds: time from audio start
+        :type milli_seconds: float
+        :param frames: audio length in frames
+        :type frames: int
+        :param sample_rate: audio sample rate
+        :type sample_rate: int
+        :return: sample offset
+        :rtype: int
+        """
+        length = round(1000 * (float(frames) / sample_rate))  # AudioSegment len()
+        return int(min(milli_seconds, length) * (sample_rate / 1000.0))
+
+    def cut(self, start, end):
+        """
+        get samples between given times
+        :param start: start time in milli seconds
+        :type start: float
+        :param end: end time in milli seconds
+        :type end: float
+        :return: samples view (or copy if zero samples added at the end)
+        :rtype: numpy.ndarray
+        """
+        start_frame = self.position(start)
+        end_frame = self.position(end)
+        samples = self.samples[start_frame:end_frame]
+
+        # rounded length may point up to half milli second after the last sample - fill with zeros
+        missing = (end_frame - start_frame) - len(samples)
+        if missing > 0:
+            samples = np.concatenate((samples, self.silence_frames(missing)))
+        return samples
+
+    def silence_frames(self, frames):
+        """
+        :param frames: number of frames
+        :type frames: int
+        :return: zero samples in audio shape
+        :rtype: numpy.ndarray
+        """
+        return np.zeros((frames,) + self.samples.shape[1:], dtype=self.samples.dtype)
+
+    def silence(self, padding):
+        """
+        get silence samples as AudioSegment.silent adds them to the audio:
+        silence is created in 11025 frame rate and resampled to audio frame rate
+        :param padding: silence length in milli seconds
+        :type padding: float
+        :return: zero samples
+        :rtype: numpy.ndarray
+        """
+        frames = int(self.silence_frame_rate * (padding / 1000.0))
+        if frames and self.sample_rate != self.silence_frame_rate:
+            # frames count created by audioop.ratecv
+            divisor = gcd(self.silence_frame_rate, self.sample_rate)
+            in_rate = self.silence_frame_rate // divisor
+            out_rate = self.sample_rate // divisor
+            frames = ((frames - 1) * out_rate) // in_rate + 1
+        return self.silence_frames(frames)
+
+    def segment(self, start, end, padding=0):
+        """
+        get part of the audio between given times, with silence added after it if needed
+        :param start: start time in milli seconds
+        :type start: float
+        :param end: end time in milli seconds
+        :type end: float
+        :param padding: additional silence required - in milli seconds
+        :type padding: float
+        :return: segment audio (shares samples with this audio when no silence added)
+        :rtype: AudioBuffer
+        """
+        return AudioBuffer(self.cut(start, end), self.sample_rate).padded(padding)
+
+    def windows(self, starts, length):
+        """
+        get fixed length windows of the audio as rows of single strided view of the samples, without copying.
+        windows are cut at same sample offsets as segment cuts them.
+        :param starts: windows start times in milli seconds, evenly spaced, windows ending inside the audio
+        :type starts: list of float
+        :param length: window length in milli seconds
+        :type length: float
+        :return: samples of each window, shape (windows, frames) or (windows, frames, channels).
+                 None if windows offsets are not evenly spaced in samples (cut each window by segment)
+        :rtype: numpy.ndarray
+        """
+        if not starts:
+            return None
+        starts = np.array(starts, dtype=np.float64)
+        frames = len(self.samples)
+        first = np.array([AudioBuffer.frame_position(start, frames, self.sample_rate) for start in starts.tolist()])
+        last = np.array([AudioBuffer.frame_position(end, frames, self.sample_rate)
+                         for end in (starts + length).tolist()])
+        window_frames = int(last[0] - first[0])
+        step = int(first[1] - first[0]) if len(first) > 1 else 1
+        if step <= 0 or np.any(last - first != window_frames) or \
+                np.any(first != first[0] + step * np.arange(len(first))):
+            return None
+
+        views = np.lib.stride_tricks.sliding_window_view(self.samples[first[0]:], window_frames, axis=0)[::step]
+        if self.channels > 1:
+            views = np.moveaxis(views, -1, 1)  # (windows, frames, channels)
+        return views[:len(first)]
+
+    def padded(self, padding):
+        """
+        get the audio with silence added after it, as AudioSegment adds it
+        :param padding: silence length in milli seconds
+        :type padding: float
+        :return: padded audio (this audio if no silence added)
+        :rtype: AudioBuffer
+        """
+        if padding <= 0:
+            return self
+
+        if self.sample_rate < self.silence_frame_rate:
+            # AudioSegment resamples the audio itself to the silence frame rate here
+            from pydub import AudioSegment
+            audio_file = AudioSegment(self.samples.astype('<i2', copy=False).tobytes(), frame_rate=self.sample_rate,
+                                      sample_width=self.sample_width, channels=self.channels)
+            audio_file = audio_file + AudioSegment.silent(duration=padding)
+            samples = np.frombuffer(audio_file.raw_data, dtype='<i2')
+            if self.channels > 1:
+                samples = samples.reshape(-1, self.channels)
+            return AudioBuffer(samples, audio_file.frame_rate)
+
+        return AudioBuffer(np.concatenate((self.samples, self.silence(padding))), self.sample_rate)
+
+    def export(self, destination_file):
+        """
+        write audio to wav file
+        :param destination_file: wav file path, or binary file object
+        :type destination_file: str
+        :return: none
+        :rtype:
+        """
+        wav_file = wave.open(destination_file, 'wb')
+        wav_file.setnchannels(self.channels)
+        wav_file.setsampwidth(self.sample_width)
+        wav_file.setframerate(self.sample_rate)
+        wav_file.setnframes(len(self.samples))
+        wav_file.writeframesraw(self.samples.astype('<i2', copy=False).tobytes())
+        wav_file.close()
+
+    def wav_bytes(self):
+        """
+        :return: wav file content of the audio
+        :rtype: bytes
+        """
+        wav_file = io.BytesIO()
+        self.export(wav_file)
+        return wav_file.getvalue()
+
+
+class StagedPaths:
+    """
+    output path generator for a single utterance parsed in a worker process.
+    files are created in a private staging folder and renamed to their final numbered names
+    by the main process, in the same order a single process would create them.
+    """
+
+    def __init__(self, staging_folder):
+        self.staging_folder = staging_folder
+        self.files = []  # (phoneme, staged file path) in creation order
+        Path(staging_folder).mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, dst_folder, phoneme, extension=""):
+        """
+        same signature as FileParser.file_path_generator
+        :return: staged file path
+        :rtype: str
+        """
+        staged_file = os.path.join(self.staging_folder, str(len(self.files)) + extension)
+        self.files.append((phoneme, staged_file))
+        return staged_file
+
+
+def parse_pair_staged(task):
+    """
+    worker process entry (or main process when parsing is resumable): apply FileParser parser method
+    on single pair of audio and text grid files, creating output files in staging folder
+    :param task: parser method, audio file, text grid file, destination folder, parser args, staging folder,
+                 label quota of utterance (or None)
+    :type task: tuple
+    :return: created files - list of (phoneme, staged file path), utterance measures (None if not measured),
+             batch of utterance background writes - files are complete when it is done (see wait_writes)
+    :rtype: list, dict, int
+    """
+    parser, audio_file, txt_file, dst_folder, args, staging_folder, quota = task
+    file_parser = parser.__self__
+    path_generator = file_parser.path_generator
+    staged = StagedPaths(staging_folder)
+    file_parser.path_generator = staged
+    file_parser.quota = quota
+    if file_parser.measures is not None:
+        file_parser.measures = ParseStats.new_utterance()
+
+    try:
+        if args:
+            parser(audio_file, txt_file, dst_folder, args)
+        else:
+            parser(audio_file, txt_file, dst_folder)
+        batch = file_parser.end_writes()
+    finally:
+        file_parser.path_generator = path_generator  # parser may be used in this process again
+        file_parser.quota = None
+
+    return staged.files, file_parser.measures, batch
+
+
+def parse_pair_written(task):
+    """
+    worker process entry: parse_pair_staged, returning when utterance files are written (as they are renamed by
+    main process). writer threads are kept for next utterances of this process
+    """
+    staged_files, measures, batch = parse_pair_staged(task)
+    task[0].__self__.wait_writes(batch)
+    return staged_files, measures, None
+
+
 class FileParser:
-    files_dict = {}
+    files_dict = {}  # folder path: next file index
+    reserved_dict = {}  # folder path: first file index not reserved in folder counter file
+    counter_file_name = ".counter"
+    counter_block = 1000  # indexes reserved with each counter file write
+    audio_extensions = ('.flac', '.wav')  # audio files read by the parsers
+    silence_phones = ('', 'sil', 'sp', 'spn')  # alignment phones which are not speech (pauses, noise)
 
     def __init__(self, vowels=None):
         if not vowels:
             self.vowels = ['AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH', 'ER', 'EY', 'OW', 'OY', 'UH', 'UW', 'IH', 'IY']
         else:
             self.vowels = vowels
+        # vowels the codes table was built for, table names, table codes (see phoneme_codes)
+        self.codes_table = (None, None, None, None)
+        # compiled alignments (AlignmentStore) to read phonemes from instead of text grid files
+        self.alignment_store = None
+        # ShardWriter to write segments to, instead of wav and wrd files
+        self.shard_writer = None
+        # ParseManifest of destination folder, to skip utterances parsed by previous runs
+        self.manifest = None
+        # SegmentCatalog to record created segments in
+        self.catalog = None
+        # CorpusIndex of audio and alignment folders, scanned on each parsing if not set
+        self.corpus_index = None
+        # ParseStats to add stages times to, and measures of utterance being parsed (see ParseStats.new_utterance)
+        self.stats = None
+        self.measures = None
+        # number of threads encoding and writing segment files while parser goes on, 0 to write in parser thread
+        self.writer_threads = 0
+        self.writer = None  # BackgroundWriter, created on first segment
+        # LabelQuota choosing segments to cut for each label, None to cut all segments
+        self.quota = None
+        # time between starts of interval segments in milli seconds (overlapping if less than interval),
+        # None for segments one after the other
+        self.hop = None
+        # generates output file paths for the parsers, replaced by StagedPaths in worker processes
+        self.path_generator = FileParser.file_path_generator
 
     @classmethod
     def wav_splitter(cls, original_wav, start, end, destination_file):
         """
         split wav file by given times
-        :param original_wav: audio file path
-        :type original_wav: basestring
+        :param original_wav: audio file path, or the audio already decoded
+        :type original_wav: basestring or AudioBuffer
         :param start: start time for cut in milli seconds
         :type start: int
         :param end: end time for cut in milli seconds
@@ -94,16 +452,14 @@ class FileParser:
         :return: none
         :rtype:
         """
-        audio_file = AudioSegment.from_file(original_wav)
-        audio_file = audio_file[start:end]
-        audio_file.export(destination_file, format="wav")  # Exports to a wav file in the current path.
+        AudioBuffer.load(original_wav).segment(start, end).export(destination_file)
 
     @classmethod
     def silence_padding(cls, original_wav, start, end, padding, destination_file):
         """
         split wav file from start to end time and add silence after
-        :param original_wav: file to cut
-        :type original_wav: basestring
+        :param original_wav: file to cut, or the audio already decoded
+        :type original_wav: basestring or AudioBuffer
         :param start: start time from original wav - in milli seconds
         :type start: int
         :param end: end time from original wav - in milli seconds
@@ -115,50 +471,106 @@ class FileParser:
         :return: none
         :rtype:
         """
-        audio_file = AudioSegment.from_file(original_wav)
-        audio_file = audio_file[start:end]  # cut from start to end
-        silence = AudioSegment.silent(duration=padding)
-        audio_file = audio_file + silence  # add silence after end
-        audio_file.export(destination_file, format="wav")  # Exports to a wav file in the current path.
+        AudioBuffer.load(original_wav).segment(start, end, padding).export(destination_file)
+
+    @classmethod
+    def read_counter(cls, folder_path):
+        """
+        get next file index of folder from its counter file.
+        folder without counter file (created by older version) is scanned once for largest numeric file name.
+        :param folder_path: folder of numbered files
+        :type folder_path: str
+        :return: next file index
+        :rtype: int
+        """
+        counter_file = os.path.join(folder_path, cls.counter_file_name)
+        if os.path.exists(counter_file):
+            with open(counter_file, "r") as counter:
+                return int(counter.read())
+
+        new_index = 0
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                name = entry.name.split(".")[0]
+                if name.isdigit():
+                    new_index = max(new_index, int(name) + 1)
+        return new_index
+
+    @classmethod
+    def write_counter(cls, folder_path, index):
+        """
+        save next file index of folder to its counter file, unless the file has larger index
+        reserved by another process
+        :param folder_path: folder of numbered files
+        :type folder_path: str
+        :param index: next file index
+        :type index: int
+        :return: none
+        :rtype:
+        """
+        counter_file = os.path.join(folder_path, cls.counter_file_name)
+        if os.path.exists(counter_file):
+            with open(counter_file, "r") as counter:
+                saved_index = int(counter.read())
+            # index reserved by this process can be released
+            if saved_index != cls.reserved_dict.get(folder_path):
+                index = max(index, saved_index)
+
+        temp_file = f"{counter_file}.{os.getpid()}"
+        with open(temp_file, "w") as counter:
+            counter.write(str(index))
+        os.replace(temp_file, counter_file)
+
+    @classmethod
+    def save_counters(cls):
+        """
+        save next file index of each folder files were generated in, so next run continues from it.
+        indexes kept in memory are cleared, so next run in this process reads the folders (which may have
+        been deleted or changed since) again
+        """
+        for folder_path, index in cls.files_dict.items():
+            cls.write_counter(folder_path, index)
+        cls.files_dict.clear()
+        cls.reserved_dict.clear()
 
     @classmethod
     def file_path_generator(cls, dst_folder, phoneme, extension=""):
         """
-        This function generates the next file name, according to numeric increasing order
+        This function generates the next file name, according to numeric increasing order.
+        Next index of each folder is kept in memory, and reserved in blocks in the folder counter file,
+        so a new run (even after crash) continues without scanning the folder.
+        Names of existing files are skipped. The file is not created here: an empty placeholder left by a crash
+        before its data is written (or before the manifest records it) would look like a segment.
         :param dst_folder: root folder to generate new file name at
         :type dst_folder: basestring
         :param phoneme: sub folder name
         :type phoneme: basestring
-        :param extension: get the last numeric name in the folder sorting by file type
+        :param extension: file type
         :type extension: basestring
         :return: file path
         :rtype: basestring
         """
 
-        new_index = 0
-        folder_path = dst_folder + "\\" + phoneme  # get folder path
+        folder_path = os.path.join(dst_folder, phoneme)  # get folder path
 
-        if not exists(folder_path):  # case folder doesn't exists
-            makedirs(folder_path)  # create new folder path
-            cls.files_dict[folder_path] = 0  # create new key in the dictionary
-            return folder_path + "\\" + str(0) + extension  # return path and file name zero
-        else:
-            if folder_path in cls.files_dict:  # check if folder is in the dictionary
-                val = cls.files_dict[folder_path]  # get last index
-                val += 1  # increase
-                cls.files_dict[folder_path] = val  # update dictionary
-                return folder_path + "\\" + str(val) + extension  # return path and new file name
-            else:
-                # folder not in the dictionary - goes to file system
-                list_of_files = glob.glob(folder_path + "\\*" + extension)  # * means all if need specific format
-                if list_of_files:
-                    latest_file = max(list_of_files, key=os.path.getctime)  # check largest number of file names
-                    import ntpath
-                    latest_file = ntpath.basename(latest_file).split(".")[0]
-                    if latest_file.isdigit():
-                        new_index = int(latest_file) + 1
-                cls.files_dict[folder_path] = new_index  # add folder to dictionary
-                return folder_path + "\\" + str(new_index) + extension  # return folder path and new index file name
+        if folder_path not in cls.files_dict:  # first file in folder by this process
+            Path(folder_path).mkdir(parents=True, exist_ok=True)
+            index = cls.read_counter(folder_path)
+            cls.files_dict[folder_path] = index  # create new key in the dictionary
+            cls.reserved_dict[folder_path] = index
+
+        while True:
+            index = cls.files_dict[folder_path]  # get next index
+            cls.files_dict[folder_path] = index + 1  # update dictionary
+
+            # reserve next indexes block in counter file
+            if index >= cls.reserved_dict[folder_path]:
+                cls.write_counter(folder_path, index + cls.counter_block)
+                cls.reserved_dict[folder_path] = index + cls.counter_block
+
+            file_path = os.path.join(folder_path, str(index) + extension)
+            if not os.path.exists(file_path):  # else name taken by another writer
+                return file_path  # return folder path and new index file name
 
     @classmethod
     def write_to_wrd(cls, phonemes_list, wrd_file):
@@ -172,7 +584,18 @@ class FileParser:
         :rtype:
         """
 
-        file = open(wrd_file, "w")
+        with open(wrd_file, "w") as file:
+            file.writelines(cls.wrd_lines(phonemes_list))
+
+    @classmethod
+    def wrd_lines(cls, phonemes_list):
+        """
+        convert phonemes to wrd format lines
+        :param phonemes_list: phonemes with times related to the audio file
+        :type phonemes_list: list
+        :return: line for each phoneme: start frame, end frame, phoneme
+        :rtype: list of str
+        """
         lines = []
         for item in phonemes_list:
             # sample rate 16000 (milli sec to sr)
@@ -181,12 +604,123 @@ class FileParser:
             start_wrd = round(start_wrd)
             end_wrd = round(end_wrd)
             # create string
-            str_to_file = str(start_wrd) + " " + str(end_wrd) + " " + item['phoneme'] + "\n"
-            # write to file
-            lines.append(str_to_file)
+            lines.append(str(start_wrd) + " " + str(end_wrd) + " " + item['phoneme'] + "\n")
+        return lines
+
+    def write_segment(self, dst_folder, label, segment, phonemes_list=None):
+        """
+        write single segment created by parser: to shard if parser has shard writer,
+        otherwise to next numbered wav file in label folder (with wrd file if phonemes given)
+        :param dst_folder: root folder for output files
+        :type dst_folder: str
+        :param label: segment label (sub folder name)
+        :type label: str
+        :param segment: segment audio
+        :type segment: AudioBuffer
+        :param phonemes_list: phonemes in segment with times related to segment, None if no wrd needed
+        :type phonemes_list: list
+        :return: none
+        :rtype:
+        """
+        if self.shard_writer is not None:
+            # shard members are written in order, by this thread
+            start = time.perf_counter() if self.measures is not None else None
+            wav = segment.wav_bytes()
+            wrd = None if phonemes_list is None else "".join(FileParser.wrd_lines(phonemes_list)).encode()
+            if start is not None:
+                start = FileParser.measure(self.measures, 'encode', start)
+            self.shard_writer.add(label, wav, wrd)
+            if start is not None:
+                FileParser.measure(self.measures, 'write', start, len(wav))
+            return
+
+        # file name is taken in parsing order, before writing
+        dst_file = self.path_generator(dst_folder, label, '.wav')
+        if not self.writer_threads:
+            FileParser.write_segment_file(dst_file, segment, phonemes_list, self.measures)
+            return
+
+        if self.writer is None:
+            self.writer = BackgroundWriter(self.writer_threads)
+        # encoded and written by writer thread, waits here if writer queue is full
+        self.writer.submit(FileParser.write_segment_file, dst_file, segment, phonemes_list, self.measures)
+
+    @classmethod
+    def write_segment_file(cls, dst_file, segment, phonemes_list=None, measures=None):
+        """
+        write segment wav file, and wrd file if phonemes given
+        :param dst_file: wav file path
+        :type dst_file: str
+        :param segment: segment audio
+        :type segment: AudioBuffer
+        :param phonemes_list: phonemes in segment with times related to segment, None if no wrd needed
+        :type phonemes_list: list
+        :param measures: utterance measures to add encode and write times to, None if not measured
+        :type measures: dict
+        :return: none
+        :rtype:
+        """
+        start = time.perf_counter() if measures is not None else None
+        wav = segment.wav_bytes()
+        if start is not None:
+            start = cls.measure(measures, 'encode', start)
+
+        with open(dst_file, 'wb') as wav_file:
+            wav_file.write(wav)
+        if phonemes_list is not None:
+            cls.write_to_wrd(phonemes_list, dst_file.replace(".wav", ".wrd"))
+
+        if start is not None:
+            cls.measure(measures, 'write', start, len(wav))
+
+    def end_writes(self):
+        """
+        end batch of background writes of utterance, so its writes can be waited for while next utterance is parsed
+        :return: writes batch, None if parser has no writer
+        :rtype: int
+        """
+        return self.writer.end_batch() if self.writer is not None else None
+
+    def wait_writes(self, batch):
+        """
+        wait for background writes of batch to finish (keeping writer threads), raising write error if any
+        :param batch: batch returned by end_writes
+        :type batch: int
+        """
+        if self.writer is not None and batch is not None:
+            self.writer.wait(batch)
+
+    def close_writer(self):
+        """
+        wait for background writes of parser to finish and stop writer threads, raising write error if any
+        """
+        if self.writer is not None:
+            writer = self.writer
+            self.writer = None
+            writer.close()
 
-        file.writelines(lines)
-        file.close()
+    @classmethod
+    def measure(cls, measures, stage, start, segment_bytes=None):
+        """
+        add time passed since start to stage time of utterance being parsed (may be called by writer threads)
+        :param measures: utterance measures (see ParseStats.new_utterance)
+        :type measures: dict
+        :param stage: stage name (see ParseStats.stages)
+        :type stage: str
+        :param start: stage start time (time.perf_counter)
+        :type start: float
+        :param segment_bytes: size of segment written, to count it
+        :type segment_bytes: int
+        :return: current time, start of next stage
+        :rtype: float
+        """
+        now = time.perf_counter()
+        with MEASURES_LOCK:
+            measures[stage] += now - start
+            if segment_bytes is not None:
+                measures['segments'] += 1
+                measures['bytes'] += segment_bytes
+        return now
 
     @classmethod
     def get_phonemes_in_interval(cls, phonemes_list, start, end):
@@ -225,6 +759,157 @@ class FileParser:
 
         return sub_list
 
+    @classmethod
+    def get_phonemes_in_intervals(cls, phonemes_list, end_of_file, interval, exclusive=True):
+        """
+        This function splits given list to phonemes in each interval from start of file, in single pass.
+        Phoneme is in interval by get_phonemes_in_interval rule: if half or more from the phoneme is in it.
+        :param phonemes_list: list of phonemes in different times
+        :type phonemes_list: list
+        :param end_of_file: end time of the file in milli seconds, last interval starts before it
+        :type end_of_file: float
+        :param interval: interval length in milli seconds
+        :type interval: int
+        :param exclusive: indicates if phoneme is added only to the first interval it is in
+        :type exclusive: bool
+        :return: sub list of phonemes for each interval
+        :rtype: list of lists
+        """
+
+        # intervals times, summed same as interval loops do
+        starts = []
+        ends = []
+        start = 0
+        end = interval
+        while start < end_of_file:
+            starts.append(start)
+            ends.append(end)
+            start += interval
+            end += interval
+
+        sub_lists = [[] for _ in starts]
+
+        for item in phonemes_list:
+            duration = item['end'] - item['start']
+            # phoneme middle is inside each interval the phoneme is in - check its interval and neighbours
+            middle_index = int((item['start'] + 0.5 * duration) // interval)
+
+            for index in range(max(0, middle_index - 1), min(len(starts), middle_index + 2)):
+                start = starts[index]
+                end = ends[index]
+                in_range = item['start'] >= start and item['end'] <= end
+                # ends out of range, or starts out of range, but most of the phoneme in range
+                most_in_range = (item['start'] >= start and item['start'] + 0.5 * duration <= end) or \
+                                (item['end'] <= end and item['end'] - 0.5 * duration >= start)
+
+                if in_range or most_in_range:
+                    sub_lists[index].append(item)
+                    if exclusive:
+                        break
+
+        return sub_lists
+
+    @classmethod
+    def read_phones_tier(cls, text_grid_file):
+        """
+        read all intervals of phones tier from text grid, in single read
+        :param text_grid_file: text grid file (librispeech alignment format)
+        :type text_grid_file: basestring
+        :return: start times, end times in milli seconds, phonemes names (with stress number)
+        :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray of str
+        """
+        with open(text_grid_file, 'r') as text:
+            content = text.read()
+
+        # get phonemes section and its size
+        phones_tier = content.find('name = "phones"')
+        if phones_tier < 0:
+            raise ValueError(f"{text_grid_file} has no phones tier")
+        size = SIZE_PATTERN.search(content, phones_tier)
+        # three values for each interval: xmin, xmax, text
+        values = VALUE_PATTERN.findall(content, size.end())[:3 * int(size.group(1))]
+
+        x_min = np.fromstring(' '.join(values[0::3]), sep=' ') * 1000  # milli sec
+        x_max = np.fromstring(' '.join(values[1::3]), sep=' ') * 1000  # milli sec
+        return x_min, x_max, np.array(values[2::3], dtype=str)
+
+    def phoneme_codes(self, names):
+        """
+        get index of each phoneme name in the parser vowels.
+        phonemes with same name and different stress number get same index.
+        :param names: phonemes names
+        :type names: numpy.ndarray of str
+        :return: index in vowels list, -1 for phonemes not specified
+        :rtype: numpy.ndarray of int8
+        """
+        # sorted table of every vowel name, with and without stress number - built once for vowels list
+        if self.codes_table[0] != self.vowels:
+            table = sorted((vowel + stress, code) for code, vowel in enumerate(self.vowels)
+                           for stress in ('', '0', '1', '2'))
+            self.codes_table = (list(self.vowels),
+                                np.array([name for name, code in table]),
+                                np.array([code for name, code in table], dtype=np.int8),
+                                np.argsort(np.argsort(np.array(self.vowels, dtype=str))))
+        vowels, table_names, table_codes, ranks = self.codes_table
+
+        if not len(names):
+            return np.empty(0, dtype=np.int8)
+        positions = np.minimum(np.searchsorted(table_names, names), len(table_names) - 1)
+        found = table_names[positions] == names
+        return np.where(found, table_codes[positions], np.int8(-1))
+
+    def extract_phones_arrays(self, text_grid_file, silence=False):
+        """
+        Extracting all phones from text grid as typed arrays, coded by the parser vowels.
+        if parser has alignment store containing the utterance, phones are taken from the store instead.
+        :param text_grid_file: text grid file (librispeech alignment format)
+        :type text_grid_file: basestring
+        :param silence: indicates if to also return which phones are silence (see silence_phones)
+        :type silence: bool
+        :return: start phone times, end phone times (milli seconds), phone code (index in vowels, -1 for phones
+                 not specified), and if asked - silence flags
+        :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray of int8 (, numpy.ndarray of bool)
+        """
+        utterance_id = os.path.splitext(os.path.basename(text_grid_file))[0]
+        if self.alignment_store is not None and utterance_id in self.alignment_store:
+            # compiled alignment - code each phone of store phones table once
+            x_min, x_max, phones, stress = self.alignment_store.get(utterance_id)
+            names = np.array(self.alignment_store.phones, dtype=str)
+            codes = self.phoneme_codes(names)[phones]
+            if silence:
+                return x_min, x_max, codes, np.isin(names, self.silence_phones)[phones]
+        else:
+            x_min, x_max, names = FileParser.read_phones_tier(text_grid_file)
+            codes = self.phoneme_codes(names)
+            if silence:
+                return x_min, x_max, codes, np.isin(names, self.silence_phones)
+        return x_min, x_max, codes
+
+    def extract_phonemes_arrays(self, text_grid_file):
+        """
+        Extracting phonemes from text grid as typed arrays.
+        phonemes with same name and different stress number are combined, phonemes not specified are removed.
+        if parser has alignment store containing the utterance, phonemes are taken from the store instead.
+        :param text_grid_file: text grid file (librispeech alignment format)
+        :type text_grid_file: basestring
+        :return: start phoneme times, end phoneme times (milli seconds), phoneme code (index in vowels)
+        :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray of int8
+        """
+        x_min, x_max, codes = self.extract_phones_arrays(text_grid_file)
+
+        # remove phonemes not specified
+        specified = codes >= 0
+        return x_min[specified], x_max[specified], codes[specified]
+
+    def phonemes_to_list(self, starts, ends, codes):
+        """
+        convert phonemes arrays to list of items
+        :return: list of items: start phoneme time, end phoneme time, phoneme name
+        :rtype: list
+        """
+        return [{'start': start, 'end': end, 'phoneme': self.vowels[code]}
+                for start, end, code in zip(starts.tolist(), ends.tolist(), codes.tolist())]
+
     def extract_phonemes(self, text_grid_file):
         """
         Extracting phonemes from text grid
@@ -233,44 +918,245 @@ class FileParser:
         :return: list of items: start phoneme time, end phoneme time, phoneme name
         :rtype: list
         """
-        text = open(text_grid_file, 'r')
-        extracted_list = []
+        return self.phonemes_to_list(*self.extract_phonemes_arrays(text_grid_file))
 
-        # read until get to phonemes section
-        while True:
-            line = text.readline()
-            if line.__contains__("phones"):
-                break
-        # read until get to size section
-        while True:
-            line = text.readline()
-            if line.__contains__("size"):
-                break
-        # get size
-        size = int(line.split("size = ")[1])
-
-        for interval in range(size):
-            # read one interval
-            text.readline()
-            x_min = float(text.readline().split("xmin = ")[1]) * 1000  # milli sec
-            x_max = float(text.readline().split("xmax = ")[1]) * 1000  # milli sec
-            txt = text.readline().split("text = ")[1].split('"')[1]
-
-            # combine phonemes with same name and different number
-            if txt.endswith("1") or txt.endswith("2") or txt.endswith("0"):
-                txt = txt[:-1]
-            # remove phonemes not specified
-            if txt not in self.vowels:
-                continue
+    def vowel_ranks(self):
+        """
+        :return: rank of each parser vowel in sorted vowels names (by vowel index), built once for vowels list
+        :rtype: numpy.ndarray
+        """
+        self.phoneme_codes(np.empty(0, dtype=str))  # build table if vowels changed
+        return self.codes_table[3]
+
+    def plan_segments(self, extract_method, phonemes, end_of_file=None, interval=500):
+        """
+        get segments the parser cuts from single utterance, without reading the audio
+        :param extract_method: "by_phoneme", "by_interval" or "by_count"
+        :type extract_method: str
+        :param phonemes: utterance phonemes, as extract_phonemes_arrays returns (start, end and code arrays),
+                         or list as extract_phonemes returns
+        :type phonemes: tuple of numpy.ndarray or list
+        :param end_of_file: audio length in milli seconds (not needed by phonemes)
+        :type end_of_file: float
+        :param interval: time in milli seconds
+        :type interval: int
+        :return: list of segments: label, start and end in milli seconds, padding - silence to add after end,
+                 phonemes - list with times related to segment (None if segment has no wrd file)
+        :rtype: list of dict
+        """
+        if isinstance(phonemes, list):
+            # list of items - code phonemes names by parser vowels
+            starts = np.array([item['start'] for item in phonemes], dtype=np.float64)
+            ends = np.array([item['end'] for item in phonemes], dtype=np.float64)
+            codes = self.phoneme_codes(np.array([item['phoneme'] for item in phonemes], dtype=str))
+        else:
+            starts, ends, codes = phonemes
+
+        if extract_method == "by_phoneme":
+            # each phoneme is segment, labeled as the phoneme
+            return [{'label': self.vowels[code], 'start': start, 'end': end, 'padding': 0, 'phonemes': None}
+                    for start, end, code in zip(starts.tolist(), ends.tolist(), codes.tolist())]
+
+        if extract_method not in ("by_interval", "by_count"):
+            raise ValueError(f"unknown extract method {extract_method}")
+
+        if self.hop is not None and self.hop != interval:
+            # overlapping (or spaced) windows
+            return FileParser.plan_windows(extract_method, starts, ends, codes, self.vowels, self.vowel_ranks(),
+                                           end_of_file, interval, self.hop)
+
+        phoneme_list = self.phonemes_to_list(starts, ends, codes)
+        by_interval = extract_method == "by_interval"
+        # get phonemes in each interval.
+        # by interval - each phoneme will appear only in single interval, by count - can be counted in two
+        sub_lists = FileParser.get_phonemes_in_intervals(phoneme_list, end_of_file, interval, by_interval)
+
+        segments = []
+
+        # set interval
+        start_interval = 0
+        end_interval = interval
+        silence_padding = 0
+
+        for sub_list in sub_lists:  # each loop running deals with single interval
+
+            wrd_list = None
+            if by_interval:
+                # check phoneme for file saving
+                if not sub_list:
+                    label = "none"
+                else:
+                    label = max(set([item['phoneme'] for item in sub_list]))
+
+                # arrange times related to new file times (the new file length is interval)
+                wrd_list = [{'start': max(0, item['start'] - start_interval),
+                             'end': min(interval, item['end'] - start_interval),
+                             'phoneme': item['phoneme']} for item in sub_list]
+            else:
+                # check count for file saving
+                label = str(len(sub_list))
+
+            # check if silence need to be added (to that each output will be length of interval)
+            if silence_padding <= 0:
+                segments.append({'label': label, 'start': start_interval, 'end': end_interval,
+                                 'padding': 0, 'phonemes': wrd_list})
+            else:
+                segments.append({'label': label, 'start': start_interval, 'end': end_of_file,
+                                 'padding': silence_padding, 'phonemes': wrd_list})
+
+            # promote to next interval
+            start_interval += interval
+            end_interval += interval
+
+            silence_padding = end_interval - end_of_file
+
+        return segments
+
+    @classmethod
+    def phonemes_in_windows(cls, starts, ends, window_starts, window_ends):
+        """
+        find phonemes of many windows at once, by get_phonemes_in_interval rule: if half or more from the
+        phoneme is in window (phoneme may be in several windows)
+        :param starts: phonemes start times
+        :type starts: numpy.ndarray
+        :param ends: phonemes end times
+        :type ends: numpy.ndarray
+        :param window_starts: windows start times
+        :type window_starts: numpy.ndarray
+        :param window_ends: windows end times
+        :type window_ends: numpy.ndarray
+        :return: indicates for each window if each phoneme is in it, shape (windows, phonemes)
+        :rtype: numpy.ndarray of bool
+        """
+        window_starts_column = window_starts[:, None]
+        window_ends_column = window_ends[:, None]
+        half = 0.5 * (ends - starts)
+        return ((starts >= window_starts_column) & (ends <= window_ends_column)) | \
+               ((starts >= window_starts_column) & (starts + half <= window_ends_column)) | \
+               ((ends <= window_ends_column) & (ends - half >= window_starts_column))
+
+    @classmethod
+    def plan_windows(cls, extract_method, starts, ends, codes, vowels, ranks, end_of_file, interval, hop):
+        """
+        get segments of windows of interval length, starting every hop milli seconds. windows end inside
+        the audio, except the last window, which is padded with silence if audio ends before it.
+        phonemes of all windows are found at once: phoneme is in window by get_phonemes_in_interval rule
+        (if half or more from the phoneme is in it), so it may be in several overlapping windows.
+        labels are as plan_segments: by interval - largest phoneme name in window ("none" if no phonemes),
+        by count - number of phonemes in window.
+        :param extract_method: "by_interval" or "by_count"
+        :type extract_method: str
+        :param starts: phonemes start times in milli seconds
+        :type starts: numpy.ndarray
+        :param ends: phonemes end times in milli seconds
+        :type ends: numpy.ndarray
+        :param codes: phonemes codes (index in vowels)
+        :type codes: numpy.ndarray
+        :param vowels: phonemes name of each code
+        :type vowels: list of str
+        :param ranks: rank of each code name in sorted names (see vowel_ranks)
+        :type ranks: numpy.ndarray
+        :param end_of_file: audio length in milli seconds
+        :type end_of_file: float
+        :param interval: window length in milli seconds
+        :type interval: int
+        :param hop: time between windows starts in milli seconds
+        :type hop: int
+        :return: list of segments, as plan_segments returns
+        :rtype: list of dict
+        """
+        # windows inside the audio, and last window if audio goes on after them
+        count = int((end_of_file - interval) // hop) + 1 if end_of_file >= interval else 0
+        window_starts = np.arange(count + 1, dtype=np.float64) * hop
+        if window_starts[count] >= end_of_file or (count and window_starts[count - 1] + interval >= end_of_file):
+            window_starts = window_starts[:count]
+        window_ends = window_starts + interval
 
-            current = {'start': x_min, 'end': x_max, 'phoneme': txt}  # create item
-            extracted_list.append(current)  # add to list
+        in_window = FileParser.phonemes_in_windows(starts, ends, window_starts, window_ends)
 
-        return extracted_list
+        if extract_method == "by_count":
+            labels = in_window.sum(axis=1).astype(str).tolist()
+        else:
+            # largest name: phoneme of largest name rank in window
+            names_by_rank = [vowels[code] for code in np.argsort(ranks).tolist()]
+            largest = np.where(in_window, ranks[codes].reshape(1, -1), -1).max(axis=1, initial=-1).tolist()
+            labels = [names_by_rank[rank] if rank >= 0 else "none" for rank in largest]
+
+        # phonemes of each window with times related to window start (for wrd file)
+        phonemes = [None] * len(window_starts)
+        if extract_method == "by_interval":
+            rows, columns = np.nonzero(in_window)
+            relative_starts = np.maximum(0, starts[columns] - window_starts[rows]).tolist()
+            relative_ends = np.minimum(interval, ends[columns] - window_starts[rows]).tolist()
+            phonemes = [[] for _ in window_starts]
+            for row, start, end, code in zip(rows.tolist(), relative_starts, relative_ends, codes[columns].tolist()):
+                phonemes[row].append({'start': start, 'end': end, 'phoneme': vowels[code]})
+
+        segments = []
+        for start, end, label, wrd_list in zip(window_starts.tolist(), window_ends.tolist(), labels, phonemes):
+            if end <= end_of_file:
+                segments.append({'label': label, 'start': start, 'end': end, 'padding': 0, 'phonemes': wrd_list})
+            else:
+                segments.append({'label': label, 'start': start, 'end': end_of_file,
+                                 'padding': end - end_of_file, 'phonemes': wrd_list})
+        return segments
+
+    def cut_file(self, audio_file, txt_file, dst_folder, extract_method, interval=500):
+        """
+        cut audio file to segments planned by plan_segments, and write them
+        :param audio_file: audio file to extract data from
+        :type audio_file: str
+        :param txt_file: Text grid file to extract data from
+        :type txt_file: str
+        :param dst_folder: root folder for output files
+        :type dst_folder: str
+        :param extract_method: "by_phoneme", "by_interval" or "by_count"
+        :type extract_method: str
+        :param interval: time in milli seconds
+        :type interval: int
+        :return: none
+        :rtype:
+        """
+        measured = self.measures is not None
+        start = time.perf_counter() if measured else None
+
+        # segments chosen by label quota - utterance without chosen segments is not decoded
+        chosen = self.quota.chosen(audio_file) if self.quota is not None else None
+        if chosen is not None and not chosen:
+            return
+
+        # get phonemes arrays from Text Grid file
+        phonemes = self.extract_phonemes_arrays(txt_file)
+        if measured:
+            start = FileParser.measure(self.measures, 'text_grid', start)
+        # decode audio once for all segments
+        audio = AudioBuffer.from_file(audio_file)
+        if measured:
+            start = FileParser.measure(self.measures, 'decode', start)
+
+        segments = self.plan_segments(extract_method, phonemes, audio.duration(), interval)
+        # overlapping windows - single strided view of all windows inside the audio
+        windows = None
+        if self.hop is not None and extract_method != "by_phoneme":
+            windows = audio.windows([segment['start'] for segment in segments if not segment['padding']], interval)
+
+        for index, segment in enumerate(segments):
+            if chosen is not None and index not in chosen:
+                continue
+            if windows is not None and not segment['padding']:
+                segment_audio = AudioBuffer(windows[index], audio.sample_rate)
+            else:
+                segment_audio = audio.segment(segment['start'], segment['end'], segment['padding'])
+            if measured:
+                FileParser.measure(self.measures, 'slice', start)
+            self.write_segment(dst_folder, segment['label'], segment_audio, segment['phonemes'])
+            if measured:
+                start = time.perf_counter()
 
     def cut_file_by_phonemes(self, audio_file, txt_file, destination_folder):
         """
         Divide wav file with text grid alignment to multiple files according to phonemes.
+        each phoneme file is in sub folder only containing the phoneme.
         :param audio_file: audio file to extract data from
         :type audio_file: str
         :param txt_file: Text grid file to extract data from
@@ -280,18 +1166,7 @@ class FileParser:
         :return: none
         :rtype:
         """
-
-        # get phonemes list from Text Grid file
-        extracted = self.extract_phonemes(txt_file)
-
-        for item in extracted:
-            start_time = item['start']  # Works in milliseconds
-            end_time = item['end']
-            phoneme = item['phoneme']
-
-            # generate file name for phoneme, create sub only containing the phoneme
-            destination_file = FileParser.file_path_generator(destination_folder, phoneme, '.wav')
-            FileParser.wav_splitter(audio_file, start_time, end_time, destination_file)
+        self.cut_file(audio_file, txt_file, destination_folder, "by_phoneme")
 
     def cut_file_by_interval(self, audio_file, txt_file, dst_folder, interval=500):
         """
@@ -309,57 +1184,7 @@ class FileParser:
         :return: none
         :rtype:
         """
-        # get phonemes from text grid file
-        phoneme_list = self.extract_phonemes(txt_file)
-        # get end of file time in milli seconds
-        end_of_file = librosa.get_duration(filename=audio_file) * 1000
-
-        # set interval
-        start_interval = 0
-        end_interval = interval
-        silence_padding = 0
-
-        while start_interval < end_of_file:  # each loop running deals with single interval
-
-            # get phonemes in current interval
-            sub_list = FileParser.get_phonemes_in_interval(phoneme_list, start_interval, end_interval)
-
-            # check phoneme for file saving
-            if not sub_list:
-                common_phoneme = "none"
-            else:
-                common_phoneme = max(set([item['phoneme'] for item in sub_list]))
-
-            # generate file destination for current interval
-            dst_file = FileParser.file_path_generator(dst_folder, common_phoneme, '.wav')
-
-            # check if silence need to be added (to that each output will be length of interval)
-            if silence_padding <= 0:
-                # get sub- audio file
-                FileParser.wav_splitter(audio_file, start_interval, end_interval, dst_file)
-            else:
-                # get sub audio file
-                FileParser.silence_padding(audio_file, start_interval, end_of_file, silence_padding, dst_file)
-
-            # create corresponding wrd file
-            wrd_dst = dst_file.replace(".wav", ".wrd")
-
-            # remove phonemes so that each phoneme will appear only in single interval
-            [phoneme_list.remove(item) for item in sub_list]
-            for item in sub_list:
-                # arrange times related to new file times (the new file length is interval)
-                item['start'] -= start_interval
-                item['start'] = max(0, item['start'])
-                item['end'] -= start_interval
-                item['end'] = min(interval, item['end'])
-
-            FileParser.write_to_wrd(sub_list, wrd_dst)  # write to wrd
-
-            # promote to next interval
-            start_interval += interval
-            end_interval += interval
-
-            silence_padding = end_interval - end_of_file
+        self.cut_file(audio_file, txt_file, dst_folder, "by_interval", interval)
 
     def cut_file_by_count_phonemes_interval(self, audio_file, txt_file, dst_folder, interval=500):
         """
@@ -377,43 +1202,212 @@ class FileParser:
         :return: none
         :rtype:
         """
-        # get phonemes from text grid file
-        phoneme_list = self.extract_phonemes(txt_file)
-        # get end of file time in milli seconds
-        end_of_file = librosa.get_duration(filename=audio_file) * 1000
+        self.cut_file(audio_file, txt_file, dst_folder, "by_count", interval)
 
-        # set interval
-        start_interval = 0
-        end_interval = interval
-        silence_padding = 0
+    def segments_statistics(self, audio_path, txt_path, extract_method, interval=500, partition=None):
+        """
+        count segments each extract method creates, without reading or writing audio:
+        only alignments and audio length from file header are used.
+        :param audio_path: audio root path folder
+        :type audio_path: str
+        :param txt_path: text grid alignment root path folder
+        :type txt_path: str
+        :param extract_method: "by_phoneme", "by_interval" or "by_count"
+        :type extract_method: str
+        :param interval: time in milli seconds
+        :type interval: int
+        :param partition: part of the corpus to count (see corpus_partition.py), None for all
+        :type partition: CorpusPartition
+        :return: utterances count and audio duration, segments count and duration (seconds) of each label,
+                 segments count of each label for each speaker
+        :rtype: dict
+        """
+        statistics = {'utterances': 0, 'duration': 0.0, 'labels': {}, 'speakers': {}}
 
-        while start_interval < end_of_file:  # each loop running deals with single interval
+        for audio_file, end_of_file, segments in self.planned_segments(audio_path, txt_path, extract_method,
+                                                                       interval, partition):
+            if end_of_file is not None:
+                statistics['duration'] += end_of_file / 1000
+            statistics['utterances'] += 1
 
-            # get phonemes in current interval
-            sub_list = FileParser.get_phonemes_in_interval(phoneme_list, start_interval, end_interval)
+            # librispeech utterance id: speaker-chapter-utterance
+            speaker = os.path.basename(audio_file).split("-")[0]
+            speaker_labels = statistics['speakers'].setdefault(speaker, {})
 
-            # check count for file saving
-            count_phonemes = len(sub_list)
+            for segment in segments:
+                label = statistics['labels'].setdefault(segment['label'], {'count': 0, 'duration': 0.0})
+                label['count'] += 1
+                label['duration'] += (segment['end'] - segment['start'] + segment['padding']) / 1000
+                speaker_labels[segment['label']] = speaker_labels.get(segment['label'], 0) + 1
 
-            # generate file destination for current interval
-            dst_file = FileParser.file_path_generator(dst_folder, str(count_phonemes), '.wav')
+        return statistics
 
-            # check if silence need to be added (to that each output will be length of interval)
-            if silence_padding <= 0:
-                # get sub- audio file
-                FileParser.wav_splitter(audio_file, start_interval, end_interval, dst_file)
-            else:
-                # get sub audio file
-                FileParser.silence_padding(audio_file, start_interval, end_of_file, silence_padding, dst_file)
+    def planned_segments(self, audio_path, txt_path, extract_method, interval=500, partition=None):
+        """
+        plan segments of all utterances without reading audio: only alignments and audio length from file header
+        are used. parameters as in segments_statistics
+        :return: generator of (audio file, audio length in milli seconds (None by phoneme), segments as
+                 plan_segments returns) for each utterance, in parsing order
+        :rtype: generator
+        """
+        corpus_index = self.corpus_index
+        if corpus_index is None or not corpus_index.matches(audio_path, txt_path):
+            corpus_index = CorpusIndex(audio_path, txt_path, read_headers=False)
+
+        for files_count, pairs in self.folder_pairs(audio_path, txt_path, corpus_index, partition):
+            for audio_file, txt_file in pairs:
+                phonemes = self.extract_phonemes_arrays(txt_file)
+                end_of_file = None
+                if extract_method != "by_phoneme":
+                    sample_rate, frames = corpus_index.info(audio_file)  # header only
+                    end_of_file = float(frames) / sample_rate * 1000
+                yield audio_file, end_of_file, self.plan_segments(extract_method, phonemes, end_of_file, interval)
+
+    def select_quota(self, audio_path, txt_path, extract_method, interval=500, partition=None):
+        """
+        choose segments to cut for each label by parser label quota (see label_quota.py), if parser has quota.
+        parameters as in segments_statistics
+        """
+        if self.quota is None:
+            return
+        self.quota.select((audio_file, segments) for audio_file, end_of_file, segments
+                          in self.planned_segments(audio_path, txt_path, extract_method, interval, partition))
 
-            # promote to next interval
-            start_interval += interval
-            end_interval += interval
+    def iter_segments(self, audio_path, txt_path, extract_method="by_interval", interval=500):
+        """
+        generate segments of all audio files in memory, without writing files.
+        segments and labels are the same as parse_data_by_phonemes / parse_data_by_interval /
+        parse_data_by_phonemes_count create. only one audio file is decoded at a time.
+        :param audio_path: audio root path folder
+        :type audio_path: str
+        :param txt_path: text grid alignment root path folder
+        :type txt_path: str
+        :param extract_method: "by_phoneme", "by_interval" or "by_count"
+        :type extract_method: str
+        :param interval: time in milli seconds
+        :type interval: int
+        :return: generator of (samples, sample rate, label, phonemes) for each segment.
+                 samples are int16 (views of the decoded file when no silence is added - copy to keep them),
+                 phonemes are the wrd file phonemes with times related to segment (None if segment has no wrd)
+        :rtype: generator of (numpy.ndarray, int, str, list)
+        """
+        for files_count, pairs in self.folder_pairs(audio_path, txt_path, self.corpus_index):
+            for audio_file, txt_file in pairs:
+                phonemes = self.extract_phonemes_arrays(txt_file)
+                audio = AudioBuffer.from_file(audio_file)
 
-            silence_padding = end_interval - end_of_file
+                for segment in self.plan_segments(extract_method, phonemes, audio.duration(), interval):
+                    segment_audio = audio.segment(segment['start'], segment['end'], segment['padding'])
+                    yield segment_audio.samples, segment_audio.sample_rate, segment['label'], segment['phonemes']
+
+    @classmethod
+    def print_statistics(cls, statistics):
+        """
+        print segments statistics as segments_statistics returns
+        """
+        print(f"{statistics['utterances']} audio files, {statistics['duration']:.1f} seconds")
+        for label, values in sorted(statistics['labels'].items()):
+            print(f"{label}: {values['count']} segments, {values['duration']:.1f} seconds")
+        counts = [values['count'] for values in statistics['labels'].values()]
+        if counts:
+            print(f"smallest label: {min(counts)} segments")
+        for speaker, labels in sorted(statistics['speakers'].items()):
+            print(f"speaker {speaker}: " + ", ".join(f"{label} {count}" for label, count in sorted(labels.items())))
 
     @classmethod
-    def parse_folder_data(cls, audio_path, txt_path, dst_folder, parser, args=None, count_total=0):
+    def folder_pairs(cls, audio_path, txt_path, corpus_index=None, partition=None):
+        """
+        go over audio root folder in sorted order and pair each audio file with its text grid file
+        :param audio_path: audio root path folder
+        :type audio_path: str
+        :param txt_path: text grid alignment root path folder
+        :type txt_path: str
+        :param corpus_index: index of the folders, scanned again if not given (or of other folders)
+        :type corpus_index: CorpusIndex
+        :param partition: part of the corpus to pair (see corpus_partition.py), None for all
+        :type partition: CorpusPartition
+        :return: generator of (files count in folder, list of [audio file, text grid file]) for each folder
+        :rtype: generator
+        """
+        if corpus_index is None or not corpus_index.matches(audio_path, txt_path):
+            corpus_index = CorpusIndex(audio_path, txt_path, read_headers=False)
+        if partition is None:
+            return corpus_index.folder_pairs()
+        return ((files_count, [pair for pair in pairs if pair[0] in partition])
+                for files_count, pairs in corpus_index.folder_pairs())
+
+    @classmethod
+    def commit_staged(cls, staged_files, dst_folder, shard_writer=None, manifest=None, key=None, signature=None,
+                      catalog=None, audio_file=None):
+        """
+        move files created by worker process to their final numbered names, or to shards
+        :param staged_files: list of (phoneme, staged file path) as returned by parse_pair_staged
+        :type staged_files: list
+        :param dst_folder: folder to output parser files to
+        :type dst_folder: str
+        :param shard_writer: shards to add files to, None to move files to numbered names
+        :type shard_writer: ShardWriter
+        :param manifest: manifest to record final files names in, before and after moving them
+        :type manifest: ParseManifest
+        :param key: utterance key in manifest
+        :type key: str
+        :param signature: utterance signature in manifest
+        :type signature: list
+        :param catalog: catalog to add segments to
+        :type catalog: SegmentCatalog
+        :param audio_file: utterance audio file, for catalog
+        :type audio_file: str
+        :return: none
+        :rtype:
+        """
+        moves = []  # staged file, final file
+        segments = []  # catalog rows: path, label, duration, wrd path, shard
+        for phoneme, staged_file in staged_files:
+            name, extension = os.path.splitext(staged_file)
+            has_wrd = os.path.exists(name + ".wrd")
+            duration = None
+            if catalog is not None:
+                with wave.open(staged_file, 'rb') as wav_file:
+                    duration = wav_file.getnframes() / wav_file.getframerate()
+
+            if shard_writer is not None:
+                with open(staged_file, "rb") as file:
+                    wav = file.read()
+                wrd = None
+                if has_wrd:
+                    with open(name + ".wrd", "rb") as file:
+                        wrd = file.read()
+                member = shard_writer.add(phoneme, wav, wrd)
+                segments.append((member + ".wav", phoneme, duration, member + ".wrd" if has_wrd else None,
+                                 shard_writer.shards[-1]['file']))
+                continue
+
+            dst_file = cls.file_path_generator(dst_folder, phoneme, extension)
+            moves.append((staged_file, dst_file))
+            path = os.path.relpath(dst_file, dst_folder).replace(os.sep, "/")
+            segments.append((path, phoneme, duration, os.path.splitext(path)[0] + ".wrd" if has_wrd else None, None))
+
+            # move corresponding wrd file if created
+            if has_wrd:
+                moves.append((name + ".wrd", os.path.splitext(dst_file)[0] + ".wrd"))
+
+        # related to destination folder, so the manifest holds when destination is given by other path
+        outputs = [os.path.relpath(dst_file, dst_folder).replace(os.sep, "/") for staged_file, dst_file in moves]
+        if manifest is not None:
+            manifest.commit(key, signature, outputs)
+
+        for staged_file, dst_file in moves:
+            os.replace(staged_file, dst_file)
+
+        if catalog is not None:
+            catalog.add_utterance(audio_file, segments)
+
+        if manifest is not None:
+            manifest.done(key, signature, outputs)
+
+    @classmethod
+    def parse_folder_data(cls, audio_path, txt_path, dst_folder, parser, args=None, count_total=0, workers=1,
+                          partition=None):
         """
         parse all files in given root folder
         :param audio_path: audio root path folder
@@ -424,68 +1418,238 @@ class FileParser:
         :type txt_path: str
         :param dst_folder: folder to output parser files to
         :type dst_folder: str
-        :param parser: function to apply on each pair: audio wav file, text grid file
+        :param parser: function to apply on each pair: audio file (flac or wav), text grid file
         :type parser: function pointer
         :param args: if any needed to parse
         :type args:
-        :param count_total: total file counter, for progress printing
+        :param count_total: total count of audio files with alignment, for progress printing
         :type count_total: int
+        :param workers: number of processes to parse with. when more than one, parser should be a FileParser
+                        method. output file names are the same for any number of workers.
+        :type workers: int
+        :param partition: part of the corpus this node parses (see corpus_partition.py), None for all
+        :type partition: CorpusPartition
         :return: none
         :rtype:
         """
+        # parsing is resumable if parser has manifest, segments are recorded if parser has catalog
+        file_parser = getattr(parser, '__self__', None)
+        if workers > 1 or getattr(file_parser, 'manifest', None) is not None or \
+                getattr(file_parser, 'catalog', None) is not None:
+            cls.parse_folder_data_staged(audio_path, txt_path, dst_folder, parser, args, count_total, workers,
+                                         partition)
+            cls.save_counters()
+            return
+
+        stats = getattr(file_parser, 'stats', None)
+        # utterance measured, its measures and writes batch - reported when its writes are done, after next
+        # utterance is parsed
+        measured = None
         count = 0
-        for root, dirs, files in os.walk(audio_path):  # go over root folder
-            for file in files:
-                if not file.endswith('.wav'):
-                    continue
-
-                # get audio and text file
-                audio_file = os.path.join(root, file)
-                txt_file = txt_path + audio_file.replace(audio_path, "")
-                txt_file = txt_file.replace('.wav', '.TextGrid')
-                if not os.path.exists(txt_file):
-                    continue
-
+        corpus_index = getattr(file_parser, 'corpus_index', None)
+        for files_count, pairs in cls.folder_pairs(audio_path, txt_path, corpus_index, partition):
+            for audio_file, txt_file in pairs:
+                if stats is not None:
+                    file_parser.measures = ParseStats.new_utterance()
                 # apply parser
                 if args:
                     parser(audio_file, txt_file, dst_folder, args)
                 else:
                     parser(audio_file, txt_file, dst_folder)
+                if stats is not None:
+                    if measured is not None:
+                        file_parser.wait_writes(measured[2])  # utterance measures include its writes
+                        stats.utterance_done(measured[0], measured[1])
+                    measured = (audio_file, file_parser.measures, file_parser.end_writes())
 
             if count_total != 0:  # print progress for user
-                count += len(files)
-                if files:
+                count += len(pairs)
+                if pairs:
                     print(f"{count} out of {count_total} files were parsed")
 
-    def parse_data_by_phonemes(self, path_for_audio, path_for_txt, path_dst, count_total=0):
+        if file_parser is not None:
+            file_parser.close_writer()
+            file_parser.measures = None
+        if measured is not None:
+            stats.utterance_done(measured[0], measured[1])
+
+        cls.save_counters()
+
+    @classmethod
+    def parse_folder_data_staged(cls, audio_path, txt_path, dst_folder, parser, args, count_total, workers,
+                                 partition=None):
         """
-        apply cut by phonemes parser on files
+        parse all files in given root folder, each utterance files created in staging folder (by process pool
+        if more than one worker) and renamed by this process in the original files order,
+        so numbering doesn't depend on workers count or timing.
+        if parser has manifest, utterances already parsed are skipped, and each utterance is recorded in
+        manifest when its files are renamed. if parser has catalog, segments are added to it when renamed.
+        parameters as in parse_folder_data
         """
+        from multiprocessing import Pool
+        from contextlib import nullcontext
+        import shutil
+
+        file_parser = parser.__self__
+        manifest = file_parser.manifest
+        shard_writer = file_parser.shard_writer
+        catalog = file_parser.catalog
+        stats = file_parser.stats
+        quota = file_parser.quota
+        if manifest is not None and shard_writer is not None:
+            raise ValueError("resumable parsing is not supported with shard output")
+
+        staging_root = os.path.join(dst_folder, ".staging")
+        shutil.rmtree(staging_root, ignore_errors=True)  # files of interrupted run
+
+        # list pairs to parse, and count of pairs done when each folder is done (for progress)
+        tasks = []
+        entries = []  # manifest key and signature of each task
+        folders_end = []
+        skipped = 0
+        for files_count, pairs in cls.folder_pairs(audio_path, txt_path, file_parser.corpus_index, partition):
+            for audio_file, txt_file in pairs:
+                key = signature = None
+                if manifest is not None:
+                    key = os.path.relpath(audio_file, audio_path).replace(os.sep, "/")
+                    signature = manifest.signature(audio_file, txt_file, parser, args)
+                    if quota is not None:
+                        # utterance is parsed again if other segments are chosen
+                        signature.append(sorted(quota.chosen(audio_file) or ()))
+                    if file_parser.hop is not None:
+                        signature.append({'hop': file_parser.hop})
+                    if manifest.is_done(key, signature):
+                        skipped += 1
+                        continue
+                    # files of changed utterance, or utterance interrupted while renaming its files
+                    manifest.remove_outputs(key)
+                    if catalog is not None:
+                        catalog.remove_utterance(audio_file)
+
+                staging_folder = os.path.join(staging_root, str(len(tasks)))
+                tasks.append((parser, audio_file, txt_file, dst_folder, args, staging_folder,
+                              quota.subset(audio_file) if quota is not None else None))
+                entries.append((key, signature, audio_file))
+            folders_end.append((len(tasks), len(pairs)))
+
+        if skipped:
+            print(f"{skipped} files already parsed were skipped")
+            if stats is not None:
+                stats.skipped(skipped)
+
+        # workers write files, only this process writes to shards, manifest and catalog
+        file_parser.quota = None  # each task gets its utterance part
+        file_parser.shard_writer = None
+        file_parser.manifest = None
+        file_parser.catalog = None
+        corpus_index = file_parser.corpus_index  # not needed by workers
+        file_parser.corpus_index = None
+        # workers measure stages if stats are collected
+        file_parser.stats = None
+        if stats is not None:
+            file_parser.measures = ParseStats.new_utterance()
+
+        count = 0
+        folder_index = 0
+
+        def commit(done, staged_files, measures, batch):
+            nonlocal count, folder_index
+            key, signature, audio_file = entries[done - 1]
+            file_parser.wait_writes(batch)  # staged files are complete
+            start = time.perf_counter()
+            cls.commit_staged(staged_files, dst_folder, shard_writer, manifest, key, signature,
+                              catalog, audio_file)
+            if stats is not None:
+                measures['commit'] = time.perf_counter() - start
+                stats.utterance_done(audio_file, measures)
+
+            # print progress for user when all folder pairs are done
+            while folder_index < len(folders_end) and folders_end[folder_index][0] <= done:
+                count += folders_end[folder_index][1]
+                if count_total != 0 and folders_end[folder_index][1]:
+                    print(f"{count} out of {count_total} files were parsed")
+                folder_index += 1
+
+        try:
+            with Pool(workers) if workers > 1 else nullcontext() as pool:
+                # results arrive in tasks order. single worker - utterance is committed after next utterance is
+                # parsed, so its files are written while next utterance is parsed
+                results = pool.imap(parse_pair_written, tasks) if pool else map(parse_pair_staged, tasks)
+                previous = None
+                for done, result in enumerate(results, 1):
+                    if previous is not None:
+                        commit(done - 1, *previous)
+                    previous = result
+                if previous is not None:
+                    commit(len(tasks), *previous)
+        finally:
+            # parser is restored (and staged files removed) if a worker failed too
+            file_parser.shard_writer = shard_writer
+            file_parser.manifest = manifest
+            file_parser.catalog = catalog
+            file_parser.corpus_index = corpus_index
+            file_parser.stats = stats
+            file_parser.quota = quota
+            file_parser.measures = None
+            try:
+                # writer of this process (single worker). worker processes writers were waited for on each
+                # utterance, and their threads end with the pool
+                file_parser.close_writer()
+            finally:
+                shutil.rmtree(staging_root, ignore_errors=True)
+
+    def parse_data_by_phonemes(self, path_for_audio, path_for_txt, path_dst, count_total=0, workers=1,
+                               dry_run=False, partition=None):
+        """
+        apply cut by phonemes parser on files.
+        dry run only returns segments statistics (see segments_statistics) without creating files.
+        if parser has label quota, segments to cut are chosen before parsing (see select_quota).
+        """
+        if dry_run:
+            return self.segments_statistics(path_for_audio, path_for_txt, "by_phoneme", partition=partition)
+        self.select_quota(path_for_audio, path_for_txt, "by_phoneme", partition=partition)
         self.parse_folder_data(path_for_audio, path_for_txt, path_dst,
-                               self.cut_file_by_phonemes, None, count_total)
+                               self.cut_file_by_phonemes, None, count_total, workers, partition)
 
-    def parse_data_by_interval(self, path_for_audio, path_for_txt, path_dst, interval=500, count_total=0):
+    def parse_data_by_interval(self, path_for_audio, path_for_txt, path_dst, interval=500, count_total=0,
+                               workers=1, dry_run=False, partition=None):
         """
-        apply cut by interval parser on files
+        apply cut by interval parser on files.
+        dry run only returns segments statistics (see segments_statistics) without creating files.
+        if parser has label quota, segments to cut are chosen before parsing (see select_quota).
         """
+        if dry_run:
+            return self.segments_statistics(path_for_audio, path_for_txt, "by_interval", interval, partition)
+        self.select_quota(path_for_audio, path_for_txt, "by_interval", interval, partition)
         self.parse_folder_data(path_for_audio, path_for_txt, path_dst,
-                               self.cut_file_by_interval, interval, count_total)
+                               self.cut_file_by_interval, interval, count_total, workers, partition)
 
-    def parse_data_by_phonemes_count(self, path_for_audio, path_for_txt, path_dst, interval=500, count_total=0):
+    def parse_data_by_phonemes_count(self, path_for_audio, path_for_txt, path_dst, interval=500, count_total=0,
+                                     workers=1, dry_run=False, partition=None):
         """
-            apply cut by interval and count of phonemes parser on files
+            apply cut by interval and count of phonemes parser on files.
+            dry run only returns segments statistics (see segments_statistics) without creating files.
+            if parser has label quota, segments to cut are chosen before parsing (see select_quota).
         """
+        if dry_run:
+            return self.segments_statistics(path_for_audio, path_for_txt, "by_count", interval, partition)
+        self.select_quota(path_for_audio, path_for_txt, "by_count", interval, partition)
         self.parse_folder_data(path_for_audio, path_for_txt, path_dst,
-                               self.cut_file_by_count_phonemes_interval, interval, count_total)
+                               self.cut_file_by_count_phonemes_interval, interval, count_total, workers, partition)
 
 
-def audio_preparation(audio_files_path, destination_path):
+def audio_preparation(audio_files_path, destination_path, convert_to_wav=False, corpus_index=None):
     """
-    This function will check if audio files in flac format, then convert them to wav
+    This function counts the audio files (flac and wav), and converts flac files to wav if asked to.
+    The parsers read flac files directly, so conversion is only needed to keep a wav copy of the data.
     :param audio_files_path: root folder for audio files
     :type audio_files_path: str
     :param destination_path: path to save converted files if necessary
     :type  destination_path: str
+    :param convert_to_wav: indicates if to convert flac files to wav before parsing
+    :type convert_to_wav: bool
+    :param corpus_index: index of audio files folder to count files by, scanned if not given
+    :type corpus_index: CorpusIndex
     :return: count of files, path for files
     :rtype: int, str
     """
@@ -493,70 +1657,148 @@ def audio_preparation(audio_files_path, destination_path):
     # create destination path
     Path(destination_path).mkdir(parents=True, exist_ok=True)
 
-    # get total count of flac files
-    count = 0
-    for root, dirs, files in os.walk(audio_files_path):
-        count += len([file for file in files if file.endswith('.flac')])
+    # get count of flac and wav files
+    if corpus_index is not None:
+        counts = corpus_index.audio_counts
+    else:
+        counts = CorpusIndex.count_audio_files(audio_files_path)
 
-    print(f"found {count} audio files in format flac")
+    print(f"found {counts['.flac']} audio files in format flac")
 
     # convert flac files to wav files
-    if count != 0:
-        destination_path_wav = destination_path + "\\converted_wav"
+    if counts['.flac'] != 0 and convert_to_wav:
+        destination_path_wav = os.path.join(destination_path, "converted_wav")
         AudioFileConverter.folder_flac_to_wav(audio_files_path, destination_path_wav)
         audio_files_path = destination_path_wav
         print("files converted to .wav format")
+        counts = CorpusIndex.count_audio_files(audio_files_path)
 
-    # get total count of wav files
-    count = 0
-    for root, dirs, files in os.walk(audio_files_path):
-        count += len([file for file in files if file.endswith('.wav')])
+    # get total count of audio files to parse
+    count = sum(counts.values())
 
-    print(f"found {count} audio files in format wav")
+    print(f"found {count} audio files to parse")
 
     return count, audio_files_path
 
 
-def main(audio_files_path, text_files_path, destination_path, delete_wav_when_done=False, extract_method="by_phoneme"):
+def main(audio_files_path, text_files_path, destination_path, delete_wav_when_done=False, extract_method="by_phoneme",
+         convert_to_wav=False, workers=1, alignment_store_file=None, shard_size=None, resume=False,
+         dry_run=False, catalog=False, corpus_index_file=None, stats_file=None, slow_utterance_seconds=None,
+         writer_threads=0, features=None, shard_index=None, num_shards=1, partition_by="speaker", label_quotas=None,
+         quota_seed=None, hop=None):
     # check input
     if not os.path.isdir(audio_files_path) or not os.path.isdir(text_files_path):
         raise Exception("path not exists")
-    # convert to wav if needed
-    count, audio_files_path = audio_preparation(audio_files_path, destination_path)
+    # pair audio and text grid files in single pass (later runs read only headers of new audio files)
+    corpus_index = CorpusIndex(audio_files_path, text_files_path, corpus_index_file)
+    # convert to wav if asked to
+    count, prepared_path = audio_preparation(audio_files_path, destination_path, convert_to_wav, corpus_index)
+    if prepared_path != audio_files_path:
+        audio_files_path = prepared_path
+        corpus_index = CorpusIndex(audio_files_path, text_files_path, read_headers=False)
     # check input
     if count == 0:
         return -1
 
+    # parse only this node part of the corpus (see corpus_partition.py to merge the nodes outputs)
+    partition = None
+    if shard_index is not None and num_shards > 1:
+        from corpus_partition import CorpusPartition
+        partition = CorpusPartition(shard_index, num_shards, partition_by)
+
+    # progress counts only audio files with alignment (of this node part)
+    count = len(corpus_index)
+    if partition is not None:
+        count = sum(utterance['audio_file'] in partition for utterance in corpus_index.utterances)
+        print(f"parsing {count} audio files of corpus part {partition}")
+
     file_parser = FileParser()
+    file_parser.corpus_index = corpus_index
+    file_parser.writer_threads = writer_threads
+    # overlapping interval segments, starting every hop milli seconds
+    file_parser.hop = hop
+
+    # time parsing stages, reporting progress and slow files as json lines
+    if stats_file and not dry_run:
+        file_parser.stats = ParseStats(count, stats_file, slow_seconds=slow_utterance_seconds)
+
+    # cut only quota segments of each label, chosen randomly before decoding any audio
+    if label_quotas:
+        from label_quota import LabelQuota
+        file_parser.quota = LabelQuota(label_quotas, quota_seed)
+
+    # compile alignments once, later runs only parse new or changed text grid files
+    if alignment_store_file:
+        from alignment_store import AlignmentStore
+        file_parser.alignment_store = AlignmentStore.compile(text_files_path, alignment_store_file)
 
     # # create parser with less phonemes if needed here
     # short_phonemes = ['AA', 'AE', 'AH', 'EY', 'IH', 'IY', 'OW', 'UW']
     # file_parser_8_phonemes = FileParser(short_phonemes)
     # file_parser = file_parser_8_phonemes
 
-    if extract_method == "by_phoneme":
-        file_parser.parse_data_by_phonemes(audio_files_path, text_files_path,
-                                           destination_path, count)
-    else:
-        if extract_method == "by_interval":
-            file_parser.parse_data_by_interval(audio_files_path, text_files_path,
-                                               destination_path, 500, count)
+    # write segments to tar shards of given size instead of single files
+    if shard_size and not dry_run:
+        from shard_writer import ShardWriter
+        file_parser.shard_writer = ShardWriter(destination_path, shard_size)
+
+    # record parsed utterances, so rerun skips them
+    if resume and not dry_run:
+        from parse_manifest import ParseManifest
+        file_parser.manifest = ParseManifest(destination_path)
+
+    # record created segments, for splitting them later (see DataToFolders.split_catalog)
+    if catalog and not dry_run:
+        from segment_catalog import SegmentCatalog
+        file_parser.catalog = SegmentCatalog(destination_path)
+
+    try:
+        statistics = None
+        if extract_method == "by_phoneme":
+            statistics = file_parser.parse_data_by_phonemes(audio_files_path, text_files_path,
+                                                            destination_path, count, workers, dry_run, partition)
         else:
-            if extract_method == "by_count":
-                file_parser.parse_data_by_phonemes_count(audio_files_path, text_files_path,
-                                                         destination_path, 500, count)
-
-    if delete_wav_when_done:
-        destination_path_wav = files_save_destination + "\\converted_wav"
+            if extract_method == "by_interval":
+                statistics = file_parser.parse_data_by_interval(audio_files_path, text_files_path,
+                                                                destination_path, 500, count, workers, dry_run,
+                                                                partition)
+            else:
+                if extract_method == "by_count":
+                    statistics = file_parser.parse_data_by_phonemes_count(audio_files_path, text_files_path,
+                                                                          destination_path, 500, count, workers,
+                                                                          dry_run, partition)
+
+        # dry run - only count segments, without creating files
+        if dry_run:
+            FileParser.print_statistics(statistics)
+    finally:
+        # shards index, manifest, catalog and stats are closed if parsing failed too
+        if file_parser.shard_writer is not None:
+            file_parser.shard_writer.close()
+        if file_parser.manifest is not None:
+            file_parser.manifest.close()
+        if file_parser.catalog is not None:
+            file_parser.catalog.close()
+        if file_parser.stats is not None:
+            file_parser.stats.close()
+
+    # log-mel / mfcc features of created segments, computed only for segments not cached by previous run
+    if features and not dry_run:
+        from segment_features import SegmentFeatures
+        computed, cached = SegmentFeatures(**features).update(destination_path)
+        print(f"segment features: {computed} computed, {cached} cached")
+
+    if delete_wav_when_done and convert_to_wav:
+        destination_path_wav = os.path.join(destination_path, "converted_wav")
         AudioFileConverter.delete_wav_files(destination_path_wav)
         print("created wav files deleted")
 
 
 if __name__ == '__main__':
-    audio_base_path = "sample_data_libriSpeech\\audio"
-    text_path = "sample_data_libriSpeech\\alignment"
+    audio_base_path = os.path.join("sample_data_libriSpeech", "audio")
+    text_path = os.path.join("sample_data_libriSpeech", "alignment")
 
-    files_save_destination = "sample_data_libriSpeech\\parsed-by-interval"
+    files_save_destination = os.path.join("sample_data_libriSpeech", "parsed-by-interval")
 
     by_phoneme = "by_phoneme"  # meaning cut each the phoneme
     by_interval = "by_interval"  # meaning cut by 0.5 sec interval (tag as most common phoneme)
@@ -565,5 +1807,50 @@ if __name__ == '__main__':
 
     extract_method_chosen = by_interval
 
+    # flac files are parsed directly, set to True to keep a converted wav copy of the data
+    convert_flac_to_wav = False
+    # number of processes to parse with (output is the same for any number)
+    workers_count = os.cpu_count()
+    # threads writing segment files of each process while it goes on parsing, 0 to write in parsing thread
+    writer_threads_count = 2
+    # file to compile all alignments to, None to read text grid files on every run
+    alignment_store_path = os.path.join("sample_data_libriSpeech", "alignments.store")
+    # number of segments in each tar shard, None to write each segment to its own files
+    segments_in_shard = None
+    # skip files parsed by previous run to same destination (if stopped in the middle, or new files added)
+    resume_parsing = True
+    # only print segments count and duration of each label, without creating files
+    dry_run_statistics = False
+    # record created segments in catalog.sqlite in destination folder (used by data_to_folders.py)
+    write_segment_catalog = True
+    # file to keep audio and text grid files pairs and audio headers in, None to scan all on every run
+    corpus_index_path = os.path.join("sample_data_libriSpeech", "corpus_index.json")
+    # json lines file for progress, throughput, eta and time spent in each parsing stage, None to not measure
+    parse_stats_path = None
+    # report files parsed in more seconds than this to stats file
+    slow_file_seconds = 5.0
+    # features to compute for created segments (see segment_features.py), for example {'kind': 'mfcc'},
+    # None to not compute
+    segment_features_params = None
+    # parse only one part of the corpus on this node: index of the part, from 0, and number of parts (nodes).
+    # each node writes to its own destination folder, merged by CorpusPartition.merge (see corpus_partition.py)
+    corpus_part_index = None
+    corpus_parts_count = 1
+    # "speaker" (all utterances of speaker on same node) or "utterance"
+    corpus_partition_by = "speaker"
+    # maximal segments of each label, for example {'none': 5000} or 5000 for all labels (see label_quota.py),
+    # None to create all segments. segments are chosen randomly, same for same seed
+    segments_label_quotas = None
+    label_quotas_seed = 0
+    # by interval / by count: start a 500 ms segment every this many milli seconds (250 - half overlapping),
+    # None for segments one after the other
+    interval_hop = None
+
     main(audio_base_path, text_path, files_save_destination,
-         delete_wav_when_done=True, extract_method=extract_method_chosen)
+         delete_wav_when_done=True, extract_method=extract_method_chosen, convert_to_wav=convert_flac_to_wav,
+         workers=workers_count, alignment_store_file=alignment_store_path, shard_size=segments_in_shard,
+         resume=resume_parsing, dry_run=dry_run_statistics, catalog=write_segment_catalog,
+         corpus_index_file=corpus_index_path, stats_file=parse_stats_path, slow_utterance_seconds=slow_file_seconds,
+         writer_threads=writer_threads_count, features=segment_features_params,
+         shard_index=corpus_part_index, num_shards=corpus_parts_count, partition_by=corpus_partition_by,
+         label_quotas=segments_label_quotas, quota_seed=label_quotas_seed, hop=interval_hop)
@@ -0,0 +1,98 @@
+import random
+
+
+class LabelQuota:
+    """
+    cap on the number of segments the parser creates for each label, so labels which are much more
+    common (as "none" by interval) don't take decoding and writing time for segments dropped when balancing.
+    before parsing, segments of all utterances are planned from the alignments and audio headers only
+    (see FileParser.select_quota), and for each label a uniformly random subset of quota segments is chosen
+    by reservoir sampling over the planned segments in parsing order. the parser then cuts only chosen
+    segments, and doesn't decode utterances with no chosen segments. same seed chooses the same segments.
+    """
+
+    def __init__(self, quotas, seed=None):
+        """
+        :param quotas: maximal segments count of each label (labels not in dict are not capped),
+                       or same maximal count for all labels
+        :type quotas: dict or int
+        :param seed: random seed, for same segments on every run
+        :type seed: int
+        """
+        self.quotas = quotas
+        self.seed = seed
+        self.selected = {}  # audio file: indexes of chosen segments (in plan_segments order)
+        self.planned = {}  # label: segments count planned
+        self.kept = {}  # label: segments count chosen
+
+    def quota(self, label):
+        """
+        :param label: segment label
+        :type label: str
+        :return: maximal segments count of label, None if not capped
+        :rtype: int
+        """
+        if isinstance(self.quotas, dict):
+            return self.quotas.get(label)
+        return self.quotas
+
+    def select(self, planned_segments):
+        """
+        choose segments of each label to keep
+        :param planned_segments: (audio file, planned segments) of each utterance, in parsing order
+        :type planned_segments: iterable of (str, list of dict)
+        :return: none
+        :rtype:
+        """
+        generator = random.Random(self.seed)
+        reservoirs = {}  # label: chosen (audio file, segment index)
+        self.selected = {}
+        self.planned = {}
+
+        for audio_file, segments in planned_segments:
+            chosen = self.selected[audio_file] = set()
+            for index, segment in enumerate(segments):
+                label = segment['label']
+                seen = self.planned[label] = self.planned.get(label, 0) + 1
+                quota = self.quota(label)
+                if quota is None:
+                    chosen.add(index)
+                    continue
+
+                # keep each of the seen segments with same probability: quota / seen
+                reservoir = reservoirs.setdefault(label, [])
+                if len(reservoir) < quota:
+                    reservoir.append((audio_file, index))
+                else:
+                    replaced = generator.randrange(seen)
+                    if replaced < quota:
+                        reservoir[replaced] = (audio_file, index)
+
+        for reservoir in reservoirs.values():
+            for audio_file, index in reservoir:
+                self.selected[audio_file].add(index)
+        self.kept = {label: min(count, self.quota(label) if self.quota(label) is not None else count)
+                     for label, count in self.planned.items()}
+
+        print(f"label quotas: keeping {sum(self.kept.values())} of {sum(self.planned.values())} segments")
+
+    def chosen(self, audio_file):
+        """
+        :param audio_file: utterance audio file
+        :type audio_file: str
+        :return: indexes of utterance segments to cut, None if utterance was not in selection (cut all)
+        :rtype: set
+        """
+        return self.selected.get(audio_file)
+
+    def subset(self, audio_file):
+        """
+        :param audio_file: utterance audio file
+        :type audio_file: str
+        :return: quota with selection of single utterance only (small to pass to worker process)
+        :rtype: LabelQuota
+        """
+        quota = LabelQuota(self.quotas, self.seed)
+        if audio_file in self.selected:
+            quota.selected[audio_file] = self.selected[audio_file]
+        return quota
@@ -0,0 +1,123 @@
+import json
+import os
+
+
+class ParseManifest:
+    """
+    journal of utterances parsed to destination folder, for resuming interrupted parsing.
+    each utterance (audio and text grid pair) gets a "commit" record listing its output files before they
+    are moved to their final names, and a "done" record after. on the next run, utterances which are done
+    and didn't change are skipped. outputs of utterances which changed, or were interrupted while committed,
+    are deleted before they are parsed again.
+    """
+    file_name = "manifest.jsonl"
+
+    def __init__(self, dst_folder):
+        """
+        :param dst_folder: parser destination folder, manifest file is kept in it
+        :type dst_folder: str
+        """
+        os.makedirs(dst_folder, exist_ok=True)
+        self.dst_folder = dst_folder
+        self.manifest_file = os.path.join(dst_folder, self.file_name)
+        self.records = {}  # last record of each utterance key
+
+        if os.path.exists(self.manifest_file):
+            lines = 0
+            with open(self.manifest_file, "r") as manifest:
+                for line in manifest:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # line cut by crash while writing
+                    self.records[record['key']] = record
+
+            # keep only last record of each utterance
+            if lines > len(self.records):
+                with open(self.manifest_file + ".tmp", "w") as manifest:
+                    manifest.writelines(json.dumps(record) + "\n" for record in self.records.values())
+                os.replace(self.manifest_file + ".tmp", self.manifest_file)
+
+        self.file = open(self.manifest_file, "a")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @classmethod
+    def signature(cls, audio_file, txt_file, parser, args):
+        """
+        get signature of utterance parsing: files modification time and size, and parser settings
+        :param audio_file: audio file path
+        :type audio_file: str
+        :param txt_file: text grid file path
+        :type txt_file: str
+        :param parser: FileParser parser method
+        :type parser: function pointer
+        :param args: parser args
+        :type args:
+        :return: signature, changes when files or parsing change
+        :rtype: list
+        """
+        audio_stat = os.stat(audio_file)
+        txt_stat = os.stat(txt_file)
+        return [audio_stat.st_mtime_ns, audio_stat.st_size, txt_stat.st_mtime_ns, txt_stat.st_size,
+                parser.__name__, args, list(parser.__self__.vowels)]
+
+    def is_done(self, key, signature):
+        """
+        :param key: utterance key
+        :type key: str
+        :param signature: current utterance signature
+        :type signature: list
+        :return: True if utterance was parsed with same signature
+        :rtype: bool
+        """
+        record = self.records.get(key)
+        return record is not None and record['status'] == "done" and record['signature'] == signature
+
+    def remove_outputs(self, key):
+        """
+        delete output files of previous parsing of utterance, if any
+        :param key: utterance key
+        :type key: str
+        :return: none
+        :rtype:
+        """
+        record = self.records.pop(key, None)
+        if record is None:
+            return
+        for output_file in record['outputs']:
+            # outputs are related to destination folder
+            output_file = os.path.join(self.dst_folder, output_file)
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def write(self, key, status, signature, outputs):
+        """
+        append record and flush it to disk
+        """
+        record = {'key': key, 'status': status, 'signature': signature, 'outputs': outputs}
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.records[key] = record
+
+    def commit(self, key, signature, outputs):
+        """
+        record output files of utterance (paths related to destination folder) before they are moved
+        to their final names
+        """
+        self.write(key, "commit", signature, outputs)
+
+    def done(self, key, signature, outputs):
+        """
+        record utterance output files are in their final names
+        """
+        self.write(key, "done", signature, outputs)
+
+    def close(self):
+        self.file.close()
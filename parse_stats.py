@@ -0,0 +1,125 @@
+import json
+import time
+
+
+class ParseStats:
+    """
+    cumulative timing of parsing stages, and structured progress reports.
+    parser measures for each utterance the seconds spent in each stage (text grid parsing, audio decoding,
+    slicing, wav encoding, writing files, and renaming staged files), and counts segments and wav bytes written.
+    reports are dicts ("event": "progress", "slow_utterance" or "summary") written as json lines to log file,
+    and / or passed to callback.
+    """
+    stages = ("text_grid", "decode", "slice", "encode", "write", "commit")
+
+    def __init__(self, total=0, log_file=None, callback=None, slow_seconds=None, report_seconds=10.0):
+        """
+        :param total: number of utterances to parse, for eta
+        :type total: int
+        :param log_file: json lines file to append reports to
+        :type log_file: str
+        :param callback: function called with each report dict
+        :type callback: function pointer
+        :param slow_seconds: utterances parsed in more seconds are reported, None to not report
+        :type slow_seconds: float
+        :param report_seconds: minimal time between progress reports
+        :type report_seconds: float
+        """
+        self.total = total
+        self.callback = callback
+        self.slow_seconds = slow_seconds
+        self.report_seconds = report_seconds
+        self.log = open(log_file, "a") if log_file else None
+
+        self.times = dict.fromkeys(self.stages, 0.0)
+        self.counters = {'utterances': 0, 'skipped': 0, 'segments': 0, 'bytes': 0}
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @classmethod
+    def new_utterance(cls):
+        """
+        :return: measures of single utterance, filled by parser
+        :rtype: dict
+        """
+        measures = dict.fromkeys(cls.stages, 0.0)
+        measures['segments'] = 0
+        measures['bytes'] = 0
+        return measures
+
+    def report(self, record):
+        """
+        write report to log file and pass it to callback
+        """
+        if self.log is not None:
+            self.log.write(json.dumps(record) + "\n")
+            self.log.flush()
+        if self.callback is not None:
+            self.callback(record)
+
+    def skipped(self, count=1):
+        """
+        count utterances skipped (parsed by previous run)
+        """
+        self.counters['skipped'] += count
+
+    def utterance_done(self, audio_file, measures):
+        """
+        add utterance measures, reporting it if slow and progress if time passed since last report
+        :param audio_file: utterance audio file
+        :type audio_file: str
+        :param measures: stages seconds, segments and bytes of utterance (see new_utterance)
+        :type measures: dict
+        :return: none
+        :rtype:
+        """
+        seconds = 0.0
+        for stage in self.stages:
+            self.times[stage] += measures[stage]
+            seconds += measures[stage]
+        self.counters['utterances'] += 1
+        self.counters['segments'] += measures['segments']
+        self.counters['bytes'] += measures['bytes']
+
+        if self.slow_seconds is not None and seconds > self.slow_seconds:
+            record = {'event': 'slow_utterance', 'audio_file': audio_file, 'seconds': seconds}
+            record.update(measures)
+            self.report(record)
+
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_seconds:
+            self.last_report = now
+            self.report(self.progress('progress'))
+
+    def progress(self, event):
+        """
+        :param event: report event name
+        :type event: str
+        :return: report of counters, stages times, throughput and eta
+        :rtype: dict
+        """
+        elapsed = time.perf_counter() - self.start
+        done = self.counters['utterances']
+        record = {'event': event, 'elapsed': elapsed, 'total': self.total}
+        record.update(self.counters)
+        record['utterances_per_sec'] = done / elapsed if elapsed else 0.0
+        record['segments_per_sec'] = self.counters['segments'] / elapsed if elapsed else 0.0
+        remaining = self.total - done - self.counters['skipped']
+        record['eta_seconds'] = remaining / record['utterances_per_sec'] if done and remaining > 0 else 0.0
+        record['stages'] = dict(self.times)
+        return record
+
+    def close(self):
+        """
+        report summary and close log file
+        """
+        self.report(self.progress('summary'))
+        if self.log is not None:
+            self.log.close()
+            self.log = None
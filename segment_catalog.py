@@ -0,0 +1,98 @@
+import os
+import sqlite3
+
+
+class SegmentCatalog:
+    """
+    sqlite table of all segments the parser created in destination folder: file path (related to
+    destination folder, or name in shard), label, source utterance, speaker, duration, wrd file and shard.
+    rows are added as segments are moved to their final names, so splitting the data (see DataToFolders)
+    needs no walk over the destination folder.
+    """
+    file_name = "catalog.sqlite"
+    fields = ("path", "label", "utterance", "speaker", "duration", "wrd", "shard")
+
+    def __init__(self, catalog_file):
+        """
+        :param catalog_file: catalog file path, or destination folder to keep catalog in
+        :type catalog_file: str
+        """
+        if os.path.isdir(catalog_file):
+            catalog_file = os.path.join(catalog_file, self.file_name)
+        self.catalog_file = catalog_file
+        self.connection = sqlite3.connect(catalog_file)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS segments (path TEXT PRIMARY KEY, label TEXT, "
+                                "utterance TEXT, speaker TEXT, duration REAL, wrd TEXT, shard TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS segments_utterance ON segments (utterance)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    @classmethod
+    def utterance_id(cls, audio_file):
+        """
+        :param audio_file: audio file path
+        :type audio_file: str
+        :return: utterance id (file name without extension), speaker (librispeech id: speaker-chapter-utterance)
+        :rtype: str, str
+        """
+        utterance = os.path.splitext(os.path.basename(audio_file))[0]
+        return utterance, utterance.split("-")[0]
+
+    def add_utterance(self, audio_file, segments):
+        """
+        add segments created from single utterance, replacing rows of same paths
+        :param audio_file: utterance audio file
+        :type audio_file: str
+        :param segments: (path, label, duration in seconds, wrd path or None, shard file or None) of each segment
+        :type segments: list
+        :return: none
+        :rtype:
+        """
+        utterance, speaker = self.utterance_id(audio_file)
+        self.connection.executemany("INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    [(path, label, utterance, speaker, duration, wrd, shard)
+                                     for path, label, duration, wrd, shard in segments])
+        self.connection.commit()
+
+    def add_rows(self, rows):
+        """
+        add segments rows (as rows returns), replacing rows of same paths
+        :param rows: segments as dicts with fields names
+        :type rows: list of dict
+        :return: none
+        :rtype:
+        """
+        self.connection.executemany("INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    [tuple(row[field] for field in self.fields) for row in rows])
+        self.connection.commit()
+
+    def remove_utterance(self, audio_file):
+        """
+        remove segments of utterance (before it is parsed again)
+        :param audio_file: utterance audio file
+        :type audio_file: str
+        :return: none
+        :rtype:
+        """
+        self.connection.execute("DELETE FROM segments WHERE utterance = ?", (self.utterance_id(audio_file)[0],))
+        self.connection.commit()
+
+    def rows(self):
+        """
+        :return: all segments as dicts with fields names, ordered by path
+        :rtype: list of dict
+        """
+        cursor = self.connection.execute(f"SELECT {', '.join(self.fields)} FROM segments ORDER BY path")
+        return [dict(zip(self.fields, row)) for row in cursor]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,168 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from corpus_index import CorpusIndex
+from file_parser import AudioBuffer, FileParser
+
+
+class SegmentDataset:
+    """
+    random access to the segments the parser creates, without writing files.
+    on creation, segments of all audio files are planned from the alignments and audio headers only,
+    and kept in an index: audio file, start frame, frames count, silence padding, label and wrd phonemes of each
+    segment, in flat arrays.
+    reading a segment seeks to its start frame and decodes only its frames, so the whole audio file
+    is never loaded. segments are the same as parse_data_by_phonemes / parse_data_by_interval /
+    parse_data_by_phonemes_count create.
+    """
+
+    def __init__(self, audio_path, txt_path, extract_method="by_interval", interval=500, parser=None,
+                 prefetch=0):
+        """
+        :param audio_path: audio root path folder
+        :type audio_path: str
+        :param txt_path: text grid alignment root path folder
+        :type txt_path: str
+        :param extract_method: "by_phoneme", "by_interval" or "by_count"
+        :type extract_method: str
+        :param interval: time in milli seconds
+        :type interval: int
+        :param parser: parser to plan segments with (its vowels, alignment store and corpus index),
+                       default FileParser()
+        :type parser: FileParser
+        :param prefetch: number of threads reading segments ahead when iterating, 0 to read on request
+        :type prefetch: int
+        """
+        parser = parser or FileParser()
+        self.prefetch = prefetch
+
+        self.audio_files = []  # audio file path of each file index
+        self.sample_rates = []  # sample rate of each file index
+        self.labels = []  # label name of each label code
+        labels_index = {}
+        self.phoneme_names = []  # phoneme name of each phoneme code
+        names_index = {}
+
+        corpus_index = parser.corpus_index
+        if corpus_index is None or not corpus_index.matches(audio_path, txt_path):
+            corpus_index = CorpusIndex(audio_path, txt_path)
+
+        files, starts, counts, paddings, codes = [], [], [], [], []
+        # wrd phonemes of all segments in flat columns, segment phonemes from its offset to next offset
+        has_wrd, phoneme_offsets, phoneme_starts, phoneme_ends, phoneme_codes = [], [0], [], [], []
+        for files_count, pairs in corpus_index.folder_pairs():
+            for audio_file, txt_file in pairs:
+                sample_rate, frames = corpus_index.info(audio_file)  # header only
+                end_of_file = float(frames) / sample_rate * 1000
+                phonemes = parser.extract_phonemes_arrays(txt_file)
+
+                for segment in parser.plan_segments(extract_method, phonemes, end_of_file, interval):
+                    start_frame = AudioBuffer.frame_position(segment['start'], frames, sample_rate)
+                    end_frame = AudioBuffer.frame_position(segment['end'], frames, sample_rate)
+                    if segment['label'] not in labels_index:
+                        labels_index[segment['label']] = len(self.labels)
+                        self.labels.append(segment['label'])
+
+                    files.append(len(self.audio_files))
+                    starts.append(start_frame)
+                    counts.append(end_frame - start_frame)
+                    paddings.append(segment['padding'])
+                    codes.append(labels_index[segment['label']])
+                    has_wrd.append(segment['phonemes'] is not None)
+                    for item in segment['phonemes'] or []:
+                        if item['phoneme'] not in names_index:
+                            names_index[item['phoneme']] = len(self.phoneme_names)
+                            self.phoneme_names.append(item['phoneme'])
+                        phoneme_starts.append(item['start'])
+                        phoneme_ends.append(item['end'])
+                        phoneme_codes.append(names_index[item['phoneme']])
+                    phoneme_offsets.append(len(phoneme_starts))
+
+                self.audio_files.append(audio_file)
+                self.sample_rates.append(sample_rate)
+
+        self.files = np.array(files, dtype=np.int32)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        self.paddings = np.array(paddings, dtype=np.float64)
+        self.codes = np.array(codes, dtype=np.int16)
+        self.has_wrd = np.array(has_wrd, dtype=bool)
+        self.phoneme_offsets = np.array(phoneme_offsets, dtype=np.int64)
+        self.phoneme_starts = np.array(phoneme_starts, dtype=np.float64)
+        self.phoneme_ends = np.array(phoneme_ends, dtype=np.float64)
+        self.phoneme_codes = np.array(phoneme_codes, dtype=np.int16)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, index):
+        """
+        read single segment
+        :param index: segment index
+        :type index: int
+        :return: samples (int16), sample rate, label, phonemes with times related to segment
+                 (None if segment has no wrd)
+        :rtype: numpy.ndarray, int, str, list
+        """
+        import soundfile as sf  # loaded once, only when reading
+
+        index = range(len(self))[index]  # negative index from end, before arrays lookups
+        file_index = self.files[index]
+        count = int(self.counts[index])
+
+        with sf.SoundFile(self.audio_files[file_index]) as audio_file:
+            audio_file.seek(int(self.starts[index]))
+            samples = audio_file.read(count, dtype='int16')
+
+        audio = AudioBuffer(samples, self.sample_rates[file_index])
+        # rounded length may point up to half milli second after the last sample - fill with zeros
+        if len(samples) < count:
+            audio = AudioBuffer(np.concatenate((samples, audio.silence_frames(count - len(samples)))),
+                                audio.sample_rate)
+        audio = audio.padded(self.paddings[index])
+
+        return audio.samples, audio.sample_rate, self.labels[self.codes[index]], self.phonemes(index)
+
+    def phonemes(self, index):
+        """
+        :param index: segment index
+        :type index: int
+        :return: wrd phonemes of segment with times related to segment (None if segment has no wrd)
+        :rtype: list
+        """
+        index = range(len(self))[index]
+        if not self.has_wrd[index]:
+            return None
+        first, last = self.phoneme_offsets[index], self.phoneme_offsets[index + 1]
+        return [{'start': start, 'end': end, 'phoneme': self.phoneme_names[code]}
+                for start, end, code in zip(self.phoneme_starts[first:last].tolist(),
+                                            self.phoneme_ends[first:last].tolist(),
+                                            self.phoneme_codes[first:last].tolist())]
+
+    def __iter__(self):
+        return self.iterate()
+
+    def iterate(self, indices=None):
+        """
+        read segments in given order, using prefetch threads to read the next segments ahead
+        :param indices: segments indices (for example shuffled), default all segments in order
+        :type indices: iterable of int
+        :return: generator of segments, as __getitem__ returns
+        :rtype: generator
+        """
+        if indices is None:
+            indices = range(len(self))
+        if not self.prefetch:
+            for index in indices:
+                yield self[index]
+            return
+
+        with ThreadPoolExecutor(self.prefetch) as executor:
+            pending = deque()
+            for index in indices:
+                pending.append(executor.submit(self.__getitem__, index))
+                # keep bounded number of segments read ahead
+                if len(pending) > 2 * self.prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,280 @@
+import hashlib
+import io
+import json
+import os
+import wave
+from pathlib import Path
+import numpy as np
+from shard_writer import ShardWriter
+
+
+class SegmentFeatures:
+    """
+    log-mel or mfcc features of the segments the parser created, computed once and kept next to them.
+    segments of the same length (as 500 ms intervals) are computed together in batches: framing, fft,
+    mel filters and dct are numpy operations over the whole batch.
+    features of segment <label>/<number>.wav are saved to <label>/<number>.<tag>.npy in destination
+    folder, where tag is the features kind and hash of the features parameters, so features of different
+    parameters are kept side by side. features-<tag>.json in destination folder keeps the content hash, size and
+    modification time of each segment features were computed from: next runs read only segments whose size or
+    modification time changed, compute features only for new segments or segments whose content changed
+    (for example parsed again), and delete features of removed segments.
+    """
+    kinds = ("log_mel", "mfcc")
+    skip_folders = ("converted_wav",)
+
+    def __init__(self, kind="log_mel", window_ms=25.0, hop_ms=10.0, n_mels=40, n_mfcc=13, f_min=0.0, f_max=None,
+                 dtype="float16", batch_size=256):
+        """
+        :param kind: "log_mel" or "mfcc"
+        :type kind: str
+        :param window_ms: fft window length in milli seconds
+        :type window_ms: float
+        :param hop_ms: time between windows in milli seconds
+        :type hop_ms: float
+        :param n_mels: number of mel filters
+        :type n_mels: int
+        :param n_mfcc: number of mfcc coefficients (for "mfcc")
+        :type n_mfcc: int
+        :param f_min: lowest mel filter frequency
+        :type f_min: float
+        :param f_max: highest mel filter frequency, None for half the sample rate
+        :type f_max: float
+        :param dtype: saved features type
+        :type dtype: str
+        :param batch_size: maximal number of segments computed together
+        :type batch_size: int
+        """
+        if kind not in self.kinds:
+            raise ValueError(f"unknown features kind {kind}")
+        self.params = {'kind': kind, 'window_ms': window_ms, 'hop_ms': hop_ms, 'n_mels': n_mels,
+                       'n_mfcc': n_mfcc if kind == "mfcc" else None, 'f_min': f_min, 'f_max': f_max, 'dtype': dtype}
+        self.batch_size = batch_size
+        params_hash = hashlib.sha1(json.dumps(self.params, sort_keys=True).encode()).hexdigest()[:10]
+        self.tag = f"{kind}-{params_hash}"
+        self.filters = {}  # mel filters (and dct matrix) by sample rate
+
+    def feature_file(self, dst_folder, name):
+        """
+        :param dst_folder: destination folder of parser
+        :type dst_folder: str
+        :param name: segment name (<label>/<number>)
+        :type name: str
+        :return: features file path of segment
+        :rtype: str
+        """
+        return os.path.join(dst_folder, f"{name}.{self.tag}.npy")
+
+    def read(self, dst_folder, name):
+        """
+        :return: features of segment, shape (frames, n_mels or n_mfcc)
+        :rtype: numpy.ndarray
+        """
+        return np.load(self.feature_file(dst_folder, name))
+
+    @classmethod
+    def hz_to_mel(cls, frequency):
+        return 2595.0 * np.log10(1.0 + np.asarray(frequency) / 700.0)
+
+    @classmethod
+    def mel_to_hz(cls, mel):
+        return 700.0 * (10.0 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+    def sample_rate_filters(self, sample_rate):
+        """
+        :param sample_rate: segments sample rate
+        :type sample_rate: int
+        :return: window length and hop in samples, window function, mel filters (fft bins, n_mels),
+                 dct matrix (n_mels, n_mfcc) or None
+        :rtype: int, int, numpy.ndarray, numpy.ndarray, numpy.ndarray
+        """
+        if sample_rate in self.filters:
+            return self.filters[sample_rate]
+
+        window_length = int(round(sample_rate * self.params['window_ms'] / 1000))
+        hop = max(1, int(round(sample_rate * self.params['hop_ms'] / 1000)))
+        window = np.hanning(window_length + 1)[:-1]  # periodic hann
+
+        # triangular filters, evenly spaced on mel scale
+        n_mels = self.params['n_mels']
+        f_max = self.params['f_max'] or sample_rate / 2.0
+        edges = self.mel_to_hz(np.linspace(self.hz_to_mel(self.params['f_min']), self.hz_to_mel(f_max), n_mels + 2))
+        bins = np.fft.rfftfreq(window_length, 1.0 / sample_rate)
+        rising = (bins[:, None] - edges[None, :-2]) / (edges[1:-1] - edges[:-2])
+        falling = (edges[None, 2:] - bins[:, None]) / (edges[2:] - edges[1:-1])
+        mel_filters = np.maximum(0.0, np.minimum(rising, falling))
+
+        # orthonormal dct-ii
+        dct = None
+        if self.params['kind'] == "mfcc":
+            n = np.arange(n_mels)
+            dct = np.cos(np.pi / n_mels * (n[:, None] + 0.5) * np.arange(self.params['n_mfcc'])[None, :])
+            dct *= np.sqrt(2.0 / n_mels)
+            dct[:, 0] /= np.sqrt(2.0)
+
+        self.filters[sample_rate] = window_length, hop, window, mel_filters, dct
+        return self.filters[sample_rate]
+
+    def compute(self, batch, sample_rate):
+        """
+        compute features of same length segments
+        :param batch: segments samples, shape (segments, samples), int16
+        :type batch: numpy.ndarray
+        :param sample_rate: segments sample rate
+        :type sample_rate: int
+        :return: features, shape (segments, frames, n_mels or n_mfcc)
+        :rtype: numpy.ndarray
+        """
+        window_length, hop, window, mel_filters, dct = self.sample_rate_filters(sample_rate)
+        signal = batch.astype(np.float32) / 32768.0
+        # segment shorter than single window - fill with zeros
+        if signal.shape[1] < window_length:
+            signal = np.pad(signal, ((0, 0), (0, window_length - signal.shape[1])))
+
+        frames = np.lib.stride_tricks.sliding_window_view(signal, window_length, axis=1)[:, ::hop]
+        power = np.abs(np.fft.rfft(frames * window, axis=-1)) ** 2
+        features = np.log(np.maximum(power @ mel_filters, 1e-10))
+        if dct is not None:
+            features = features @ dct
+        return features.astype(self.params['dtype'])
+
+    @classmethod
+    def wav_samples(cls, wav):
+        """
+        :param wav: 16 bit pcm wav file content (as parser exports)
+        :type wav: bytes
+        :return: samples (int16, first channel), sample rate
+        :rtype: numpy.ndarray, int
+        """
+        with wave.open(io.BytesIO(wav), 'rb') as wav_file:
+            channels = wav_file.getnchannels()
+            samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+            return samples[::channels], wav_file.getframerate()
+
+    @classmethod
+    def segments(cls, dst_folder):
+        """
+        segments parser created in destination folder, from shards index if written to shards
+        :param dst_folder: destination folder of parser
+        :type dst_folder: str
+        :return: sorted list of (segment name, function reading its wav content, segment stat - changes when
+                 segment is written again: wav size and modification time, or shard file, position and shard
+                 modification time)
+        :rtype: list
+        """
+        segments = []
+        index_file = os.path.join(dst_folder, ShardWriter.index_file_name)
+        if os.path.exists(index_file):
+            with open(index_file, "r") as index:
+                shards = json.load(index)['shards']
+            for shard in shards:
+                modified = os.stat(os.path.join(dst_folder, shard['file'])).st_mtime_ns
+                for name, label, wav_offset, wav_size, wrd_offset, wrd_size in shard['segments']:
+                    segments.append((name, lambda shard_file=shard['file'], offset=wav_offset, size=wav_size:
+                                     ShardWriter.read_segment(dst_folder, shard_file, offset, size),
+                                     [shard['file'], wav_offset, wav_size, modified]))
+            return sorted(segments)
+
+        with os.scandir(dst_folder) as labels:
+            for label in labels:
+                if not label.is_dir() or label.name in cls.skip_folders:
+                    continue
+                with os.scandir(label.path) as files:
+                    for entry in files:
+                        name, extension = os.path.splitext(entry.name)
+                        if extension == ".wav":
+                            stat = entry.stat()
+                            segments.append((label.name + "/" + name, Path(entry.path).read_bytes,
+                                             [stat.st_size, stat.st_mtime_ns]))
+        return sorted(segments)
+
+    def update(self, dst_folder):
+        """
+        compute features of segments in destination folder, which are not cached yet
+        :param dst_folder: destination folder of parser
+        :type dst_folder: str
+        :return: number of segments computed, number of segments already cached
+        :rtype: int, int
+        """
+        index_file = os.path.join(dst_folder, f"features-{self.tag}.json")
+        cached = {}
+        if os.path.exists(index_file):
+            with open(index_file, "r") as index:
+                cached = json.load(index)['segments']
+
+        entries = {}  # index entry of each current segment: content hash and stat
+        pending = {}  # (sample rate, length) -> [names, samples, index entries]
+        pending_count = 0
+        computed = 0
+        done = False
+        try:
+            for name, read_wav, stat in self.segments(dst_folder):
+                cached_entry = cached.get(name)
+                # index of older version keeps content hash only
+                cached_hash = cached_entry['hash'] if isinstance(cached_entry, dict) else cached_entry
+                has_features = cached_entry is not None and os.path.exists(self.feature_file(dst_folder, name))
+                if has_features and isinstance(cached_entry, dict) and cached_entry['stat'] == stat:
+                    entries[name] = cached_entry  # not written since - not read
+                    continue
+
+                wav = read_wav()
+                content_hash = hashlib.sha1(wav).hexdigest()
+                if has_features and cached_hash == content_hash:
+                    entries[name] = {'hash': content_hash, 'stat': stat}
+                    continue
+
+                samples, sample_rate = self.wav_samples(wav)
+                group = pending.setdefault((sample_rate, len(samples)), [[], [], []])
+                group[0].append(name)
+                group[1].append(samples)
+                group[2].append({'hash': content_hash, 'stat': stat})
+                pending_count += 1
+                if len(group[0]) >= self.batch_size:
+                    computed += self.save_batch(dst_folder, sample_rate, group, entries)
+                    pending_count -= len(group[0])
+                    del pending[(sample_rate, len(samples))]
+                # many different lengths (as phonemes) - don't keep too many segments waiting
+                elif pending_count >= 4 * self.batch_size:
+                    for (sample_rate, length), group in pending.items():
+                        computed += self.save_batch(dst_folder, sample_rate, group, entries)
+                    pending, pending_count = {}, 0
+
+            for (sample_rate, length), group in pending.items():
+                computed += self.save_batch(dst_folder, sample_rate, group, entries)
+
+            # features of segments which no longer exist
+            for name in cached.keys() - entries.keys():
+                if os.path.exists(self.feature_file(dst_folder, name)):
+                    os.remove(self.feature_file(dst_folder, name))
+            done = True
+        finally:
+            # keep features computed so far even if stopped in the middle
+            kept = entries if done else dict(cached, **entries)
+            with open(index_file + ".tmp", "w") as index:
+                json.dump({'params': self.params, 'segments': kept}, index)
+            os.replace(index_file + ".tmp", index_file)
+
+        return computed, len(entries) - computed
+
+    def save_batch(self, dst_folder, sample_rate, group, entries):
+        """
+        compute and save features of same length segments
+        :param dst_folder: destination folder of parser
+        :type dst_folder: str
+        :param sample_rate: segments sample rate
+        :type sample_rate: int
+        :param group: segments names, samples and index entries
+        :type group: list
+        :param entries: index entry of each segment with saved features, updated
+        :type entries: dict
+        :return: number of segments computed
+        :rtype: int
+        """
+        names, samples, group_entries = group
+        features = self.compute(np.stack(samples), sample_rate)
+        for name, segment_features, entry in zip(names, features, group_entries):
+            feature_file = self.feature_file(dst_folder, name)
+            os.makedirs(os.path.dirname(feature_file), exist_ok=True)
+            np.save(feature_file, segment_features)
+            entries[name] = entry
+        return len(names)
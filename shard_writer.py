@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import tarfile
+from pathlib import Path
+
+
+class ShardWriter:
+    """
+    writes parser segments to fixed-size tar shards, instead of a wav (and wrd) file for each segment.
+    each segment is stored as <label>/<number>.wav with <label>/<number>.wrd if it has phonemes,
+    numbered for each label as the parser numbers files, so extracting all shards creates the same
+    files the parser creates.
+    index.json in the shards folder lists for each shard its segments: name, label, and position
+    and size of wav and wrd data in shard file, for reading segment without going over the shard.
+    """
+    index_file_name = "index.json"
+
+    def __init__(self, dst_folder, shard_size=10000, prefix="shard"):
+        """
+        :param dst_folder: folder to create shards in
+        :type dst_folder: str
+        :param shard_size: number of segments in each shard
+        :type shard_size: int
+        :param prefix: shard file name prefix
+        :type prefix: str
+        """
+        self.dst_folder = dst_folder
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.count = 0  # total segments written
+        self.label_counts = {}  # segments written for each label
+        self.shards = []  # index entry for each shard
+        self.tar = None
+        Path(dst_folder).mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_member(self, name, data):
+        """
+        add file to current shard
+        :param name: file name in shard
+        :type name: str
+        :param data: file content
+        :type data: bytes
+        :return: data position in shard file, data size
+        :rtype: int, int
+        """
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        # data starts after member header
+        offset = self.tar.offset + len(info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors))
+        self.tar.addfile(info, io.BytesIO(data))
+        return offset, len(data)
+
+    def add(self, label, wav, wrd=None):
+        """
+        add segment to current shard, starting new shard if current one is full
+        :param label: segment label
+        :type label: str
+        :param wav: wav file content
+        :type wav: bytes
+        :param wrd: wrd file content, None if segment has no wrd
+        :type wrd: bytes
+        :return: segment name in shard (<label>/<number>, without extension)
+        :rtype: str
+        """
+        if self.tar is None or len(self.shards[-1]['segments']) >= self.shard_size:
+            self.close_shard()
+            shard_file = f"{self.prefix}-{len(self.shards):06d}.tar"
+            self.tar = tarfile.open(os.path.join(self.dst_folder, shard_file), "w", format=tarfile.USTAR_FORMAT)
+            self.shards.append({'file': shard_file, 'segments': []})
+
+        number = self.label_counts.get(label, 0)
+        self.label_counts[label] = number + 1
+        name = f"{label}/{number}"
+        wav_offset, wav_size = self.add_member(name + ".wav", wav)
+        wrd_offset, wrd_size = self.add_member(name + ".wrd", wrd) if wrd is not None else (None, None)
+
+        self.shards[-1]['segments'].append([name, label, wav_offset, wav_size, wrd_offset, wrd_size])
+        self.count += 1
+        return name
+
+    def close_shard(self):
+        """
+        close current shard file if open
+        """
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+    def close(self):
+        """
+        close current shard and write shards index
+        """
+        self.close_shard()
+        with open(os.path.join(self.dst_folder, self.index_file_name), "w") as index:
+            json.dump({'shard_size': self.shard_size, 'count': self.count, 'shards': self.shards}, index)
+
+    @classmethod
+    def read_segment(cls, dst_folder, shard_file, offset, size):
+        """
+        read single file of segment from shard, using position from index
+        :param dst_folder: shards folder
+        :type dst_folder: str
+        :param shard_file: shard file name
+        :type shard_file: str
+        :param offset: data position in shard
+        :type offset: int
+        :param size: data size
+        :type size: int
+        :return: file content
+        :rtype: bytes
+        """
+        with open(os.path.join(dst_folder, shard_file), "rb") as shard:
+            shard.seek(offset)
+            return shard.read(size)
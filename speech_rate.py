@@ -0,0 +1,230 @@
+import csv
+import os
+import numpy as np
+from corpus_index import CorpusIndex
+from file_parser import FileParser
+
+
+class SpeechRate:
+    """
+    vowel speech rate statistics of a corpus, computed from the alignments only (no audio is read).
+    vowels are the phonemes the parser keeps (FileParser vowels, stress numbers combined), and the utterance
+    length is the end of its phones tier. for each utterance, speaker and chapter:
+    vowel rate (vowels per second of utterance), articulation rate (vowels per second of speech, without
+    silence phones), vowel duration distribution, and vowels count in windows of each given interval -
+    counted by the rule by_count parsing labels segments with (if half or more from the vowel is in window).
+    all times in the table are in seconds.
+    """
+    levels = ("utterance", "speaker", "chapter")
+    quantiles = (0.1, 0.5, 0.9)
+
+    def __init__(self, txt_path, parser=None, intervals=(500,)):
+        """
+        :param txt_path: text grid alignment root path folder
+        :type txt_path: str
+        :param parser: parser to extract vowels with (its vowels and alignment store), default FileParser()
+        :type parser: FileParser
+        :param intervals: windows lengths in milli seconds to count vowels in
+        :type intervals: tuple of int
+        """
+        parser = parser or FileParser()
+        self.intervals = tuple(intervals)
+
+        self.utterances = []  # utterance ids, in folders order
+        durations = []  # utterance length (milli seconds)
+        speech_durations = []  # utterance length without silence phones (milli seconds)
+        vowel_durations = []  # duration of each vowel of each utterance (milli seconds)
+        window_counts = {interval: [] for interval in self.intervals}  # vowels count of each utterance window
+
+        for relative_path, entries, dirs in CorpusIndex.scan(txt_path):
+            for entry in entries:
+                utterance, extension = os.path.splitext(entry.name)
+                if extension != CorpusIndex.txt_extension:
+                    continue
+                starts, ends, codes, silence = parser.extract_phones_arrays(entry.path, silence=True)
+                end_of_file = float(ends.max()) if len(ends) else 0.0
+                vowels = codes >= 0
+
+                self.utterances.append(utterance)
+                durations.append(end_of_file)
+                speech_durations.append(float(np.sum((ends - starts)[~silence])))
+                vowel_durations.append(ends[vowels] - starts[vowels])
+
+                for interval in self.intervals:
+                    window_starts = np.arange(np.ceil(end_of_file / interval)) * interval
+                    in_window = FileParser.phonemes_in_windows(starts[vowels], ends[vowels],
+                                                               window_starts, window_starts + interval)
+                    window_counts[interval].append(in_window.sum(axis=1))
+
+        # utterance index of each vowel and each window, for grouping with bincount
+        self.durations = np.array(durations, dtype=np.float64) / 1000
+        self.speech_durations = np.array(speech_durations, dtype=np.float64) / 1000
+        self.vowel_counts = np.array([len(item) for item in vowel_durations], dtype=np.int64)
+        self.vowel_durations = np.concatenate(vowel_durations) / 1000 if vowel_durations else np.empty(0)
+        self.vowel_utterances = np.repeat(np.arange(len(self.utterances)), self.vowel_counts)
+        self.window_counts = {}
+        self.window_utterances = {}
+        for interval, counts in window_counts.items():
+            self.window_counts[interval] = np.concatenate(counts) if counts else np.empty(0, dtype=np.int64)
+            self.window_utterances[interval] = np.repeat(np.arange(len(self.utterances)),
+                                                         [len(item) for item in counts])
+
+    def __len__(self):
+        return len(self.utterances)
+
+    def groups(self, level):
+        """
+        :param level: "utterance", "speaker" or "chapter"
+        :type level: str
+        :return: group names, group index of each utterance
+        :rtype: list of str, numpy.ndarray
+        """
+        if level not in self.levels:
+            raise ValueError(f"unknown level {level}")
+        if level == "utterance":
+            return self.utterances, np.arange(len(self.utterances))
+        # librispeech utterance id: speaker-chapter-utterance
+        parts = 1 if level == "speaker" else 2
+        keys = np.array(["-".join(utterance.split("-")[:parts]) for utterance in self.utterances], dtype=str)
+        names, indexes = np.unique(keys, return_inverse=True)
+        return names.tolist(), indexes.reshape(-1)
+
+    @classmethod
+    def group_quantiles(cls, groups, values, group_count, quantiles):
+        """
+        quantiles of values of each group, all groups at once (lower value for positions between values)
+        :param groups: group index of each value
+        :type groups: numpy.ndarray
+        :param values: values
+        :type values: numpy.ndarray
+        :param group_count: number of groups
+        :type group_count: int
+        :param quantiles: quantiles to compute, in [0, 1]
+        :type quantiles: tuple of float
+        :return: quantiles of each group, shape (groups, quantiles), nan for groups without values
+        :rtype: numpy.ndarray
+        """
+        ordered = values[np.lexsort((values, groups))]
+        counts = np.bincount(groups, minlength=group_count)
+        firsts = np.cumsum(counts) - counts
+        result = np.full((group_count, len(quantiles)), np.nan)
+        has_values = counts > 0
+        for column, quantile in enumerate(quantiles):
+            positions = firsts + np.floor(quantile * (counts - 1)).astype(np.int64)
+            result[has_values, column] = ordered[positions[has_values]]
+        return result
+
+    def table(self, level="utterance"):
+        """
+        :param level: "utterance", "speaker" or "chapter"
+        :type level: str
+        :return: statistics row of each utterance / speaker / chapter
+        :rtype: list of dict
+        """
+        names, indexes = self.groups(level)
+        count = len(names)
+
+        def group_sum(utterance_groups, weights=None):
+            return np.bincount(utterance_groups, weights, minlength=count)
+
+        utterances = group_sum(indexes)
+        durations = group_sum(indexes, self.durations)
+        speech_durations = group_sum(indexes, self.speech_durations)
+        vowels = group_sum(indexes, self.vowel_counts)
+        vowel_groups = indexes[self.vowel_utterances]
+        vowel_time = group_sum(vowel_groups, self.vowel_durations)
+        vowel_squares = group_sum(vowel_groups, self.vowel_durations ** 2)
+        quantiles = self.group_quantiles(vowel_groups, self.vowel_durations, count, self.quantiles)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns = {
+                'utterances': utterances.astype(np.int64),
+                'duration': durations,
+                'speech_duration': speech_durations,
+                'vowels': vowels.astype(np.int64),
+                'vowel_rate': vowels / durations,
+                'articulation_rate': vowels / speech_durations,
+                'vowel_duration_mean': vowel_time / vowels,
+                'vowel_duration_std': np.sqrt(np.maximum(vowel_squares / vowels - (vowel_time / vowels) ** 2, 0)),
+            }
+            for column, quantile in enumerate(self.quantiles):
+                columns[f'vowel_duration_p{int(quantile * 100)}'] = quantiles[:, column]
+
+            for interval in self.intervals:
+                window_groups = indexes[self.window_utterances[interval]]
+                window_counts = self.window_counts[interval]
+                windows = group_sum(window_groups)
+                mean = group_sum(window_groups, window_counts) / windows
+                columns[f'vowels_per_{interval}ms_mean'] = mean
+                columns[f'vowels_per_{interval}ms_std'] = np.sqrt(np.maximum(
+                    group_sum(window_groups, window_counts.astype(np.float64) ** 2) / windows - mean ** 2, 0))
+                columns[f'vowels_per_{interval}ms_max'] = self.group_max(window_groups, window_counts, count)
+
+        rows = []
+        lists = {name: values.tolist() for name, values in columns.items()}
+        for row_index, name in enumerate(names):
+            row = {'level': level, 'id': name}
+            for column, values in lists.items():
+                value = values[row_index]
+                if isinstance(value, float):
+                    value = None if np.isnan(value) else round(value, 4)  # nan - no vowels or windows
+                row[column] = value
+            rows.append(row)
+        return rows
+
+    @classmethod
+    def group_max(cls, groups, values, group_count):
+        """
+        :return: largest value of each group, 0 for groups without values
+        :rtype: numpy.ndarray
+        """
+        result = np.zeros(group_count, dtype=values.dtype)
+        np.maximum.at(result, groups, values)
+        return result
+
+    def histogram(self, interval):
+        """
+        :param interval: window length in milli seconds (one of intervals)
+        :type interval: int
+        :return: number of windows of the corpus with each vowels count (index), as by_count folders sizes
+        :rtype: numpy.ndarray
+        """
+        return np.bincount(self.window_counts[interval].astype(np.int64))
+
+    def write(self, table_file, levels=levels):
+        """
+        write statistics of given levels to single csv table
+        :param table_file: csv file path
+        :type table_file: str
+        :param levels: levels to write
+        :type levels: tuple of str
+        :return: none
+        :rtype:
+        """
+        rows = [row for level in levels for row in self.table(level)]
+        if not rows:
+            return
+        with open(table_file, "w", newline="") as table:
+            writer = csv.DictWriter(table, list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    text_path = os.path.join("sample_data_libriSpeech", "alignment")
+    # csv table of utterances, speakers and chapters statistics
+    speech_rate_table = os.path.join("sample_data_libriSpeech", "speech_rate.csv")
+    # windows lengths (milli seconds) to count vowels in
+    count_intervals = (500, 1000)
+    # file alignments were compiled to by file_parser.py, None to read text grid files
+    alignment_store_path = os.path.join("sample_data_libriSpeech", "alignments.store")
+
+    vowels_parser = FileParser()
+    if alignment_store_path and os.path.exists(alignment_store_path):
+        from alignment_store import AlignmentStore
+        vowels_parser.alignment_store = AlignmentStore(alignment_store_path)
+
+    speech_rate = SpeechRate(text_path, vowels_parser, count_intervals)
+    speech_rate.write(speech_rate_table)
+    for interval in count_intervals:
+        print(f"windows of {interval} ms by vowels count: {speech_rate.histogram(interval).tolist()}")